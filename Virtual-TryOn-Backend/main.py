@@ -1,6 +1,10 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from routers import virtual_try_on
 from routers.token_manager import token_manager
+from utils.uploads import BodySizeLimitMiddleware, MAX_BATCH_REQUEST_BODY_MB
+from utils.metrics import registry, METRICS_CONTENT_TYPE
+from utils.jobs import claim_job_store_process
 import logging
 
 # Configure logging
@@ -13,12 +17,27 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse oversized bodies before the multipart parser spools them
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    path_max_mb={"/api/virtual-try-on/batch": MAX_BATCH_REQUEST_BODY_MB}
+)
+
 # Include routers with API prefix
 app.include_router(virtual_try_on.router, prefix="/api")
 
 @app.on_event("startup")
 async def startup_event():
+    # Jobs are held in memory, so only one worker process serves them
+    claim_job_store_process()
     await token_manager.start_processor()
+    # Build the Gradio clients concurrently in the background so startup is
+    # not blocked; /api/ready reports progress
+    token_manager.start_initialization()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await token_manager.shutdown()
 
 @app.get("/")
 async def root():
@@ -28,6 +47,17 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "virtual-try-on-api"}
 
+@app.get("/api/ready")
+async def readiness_check():
+    """503 until at least one token has a ready client"""
+    readiness = token_manager.get_readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, queue and token state, cache and failure counters in Prometheus text format"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8011)
\ No newline at end of file
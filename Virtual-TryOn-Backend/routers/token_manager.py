@@ -1,38 +1,247 @@
 import os
 import asyncio
+import hashlib
+import math
+import threading
 import time
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Dict, Optional
+import httpx
 from gradio_client import Client, handle_file
 import logging
+from utils.metrics import registry, Registry, Counter, Gauge, STAGE_SECONDS, CACHE_HITS, CACHE_MISSES, PROVIDER_FAILURES
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Token circuit breaker settings. A ZeroGPU quota error puts the token into a
+# cooldown; repeated errors open its circuit. Both back off exponentially and
+# end in a half-open state where one probe request decides whether the token
+# is healthy again.
+HF_QUOTA_COOLDOWN_SECONDS = float(os.getenv("HF_QUOTA_COOLDOWN_SECONDS") or 900)
+HF_QUOTA_COOLDOWN_MAX_SECONDS = float(os.getenv("HF_QUOTA_COOLDOWN_MAX_SECONDS") or 6 * 3600)
+HF_ERROR_THRESHOLD = int(os.getenv("HF_ERROR_THRESHOLD") or 3)
+HF_CIRCUIT_OPEN_SECONDS = float(os.getenv("HF_CIRCUIT_OPEN_SECONDS") or 30)
+HF_CIRCUIT_OPEN_MAX_SECONDS = float(os.getenv("HF_CIRCUIT_OPEN_MAX_SECONDS") or 1800)
+
+# Token states
+TOKEN_CLOSED = "closed"        # healthy
+TOKEN_COOLDOWN = "cooldown"    # waiting out a quota error
+TOKEN_OPEN = "open"            # too many errors, waiting before a probe
+TOKEN_HALF_OPEN = "half_open"  # next request is a probe
+TOKEN_INITIALIZING = "initializing"  # Gradio client not built yet
+
+# How long a caller waits for its result before giving up
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS") or 120)
+# Service-time model used for admission control: an EWMA of predict latency
+# per token, seeded with HF_DEFAULT_SERVICE_SECONDS until measured
+HF_LATENCY_EWMA_ALPHA = float(os.getenv("HF_LATENCY_EWMA_ALPHA") or 0.2)
+HF_DEFAULT_SERVICE_SECONDS = float(os.getenv("HF_DEFAULT_SERVICE_SECONDS") or 20)
+
+# Uploaded garments are reused per token for this long; keep it below the
+# lifetime of files in the Space's upload cache
+HF_REMOTE_FILE_TTL_SECONDS = float(os.getenv("HF_REMOTE_FILE_TTL_SECONDS") or 1800)
+HF_REMOTE_FILE_MAX_ENTRIES = int(os.getenv("HF_REMOTE_FILE_MAX_ENTRIES") or 256)
+
+HF_SPACE = os.getenv("HF_SPACE") or "levihsu/OOTDiffusion"
+HF_CLIENT_INIT_ATTEMPTS = int(os.getenv("HF_CLIENT_INIT_ATTEMPTS") or 3)
+HF_CLIENT_INIT_BACKOFF_SECONDS = float(os.getenv("HF_CLIENT_INIT_BACKOFF_SECONDS") or 2)
+
+def default_client_factory(token: str):
+    """Build a Gradio client for the Space; does a network handshake"""
+    return Client(HF_SPACE, hf_token=token)
+
+class QueuedJob:
+    """
+    One queued predict, shared by every caller with the same content.
+
+    `deadline` is an absolute wall-clock time (so it survives the hop from the
+    backend); callers joining a shared job push it out to their own deadline.
+    With `owns_inputs` the job deletes its input files once a worker is done
+    with it, whichever caller is still waiting by then.
+    """
+    __slots__ = ("request_id", "vton_img_path", "garm_img_path", "future", "deadline", "seq", "garm_digest", "enqueued_at", "owns_inputs")
+
+    def __init__(self, request_id: str, vton_img_path: str, garm_img_path: str, future: asyncio.Future, deadline: float, seq: int = 0, garm_digest: Optional[str] = None, owns_inputs: bool = False):
+        self.request_id = request_id
+        self.owns_inputs = owns_inputs
+        self.garm_digest = garm_digest  # sha256 of the garment, for reusing its upload
+        self.seq = seq  # enqueue order, for queue positions
+        self.vton_img_path = vton_img_path
+        self.garm_img_path = garm_img_path
+        self.future = future
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()  # for the queue wait metric
+
+    def abandoned(self) -> bool:
+        """Nobody will read the result: every caller gave up or the deadline passed"""
+        return self.future.done() or time.time() >= self.deadline
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def upload_to_space(client, path: str) -> dict:
+    """
+    Upload a file to the Space the way gradio_client does and return a file
+    reference that can be passed to `submit` in place of `handle_file(path)`.
+
+    The reference has no "meta" key, so gradio_client sends it as-is instead
+    of uploading the file again; the server resolves the path in its own
+    upload cache.
+    """
+    name = Path(path).name
+    with open(path, "rb") as f:
+        response = httpx.post(
+            client.upload_url,
+            headers=client.headers,
+            cookies=client.cookies,
+            verify=client.ssl_verify,
+            files=[("files", (name, f))],
+            **client.httpx_kwargs
+        )
+    response.raise_for_status()
+    return {"path": response.json()[0], "orig_name": name}
+
+class RemoteFileCache:
+    """
+    Per-token LRU of files already uploaded to the Space, keyed by content hash.
+
+    Used from the predict threads, hence the lock. Entries expire after
+    HF_REMOTE_FILE_TTL_SECONDS and are dropped early when a call using them fails.
+    """
+
+    def __init__(self, ttl_seconds: float = HF_REMOTE_FILE_TTL_SECONDS, max_entries: int = HF_REMOTE_FILE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, "OrderedDict[str, tuple]"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str, digest: str) -> Optional[dict]:
+        with self._lock:
+            entries = self._entries.get(token)
+            entry = entries.get(digest) if entries else None
+            if entry is None or time.time() - entry[1] >= self.ttl_seconds:
+                if entry is not None:
+                    del entries[digest]
+                self.misses += 1
+                CACHE_MISSES.inc(cache="remote_file")
+                return None
+            entries.move_to_end(digest)
+            self.hits += 1
+            CACHE_HITS.inc(cache="remote_file")
+            return entry[0]
+
+    def set(self, token: str, digest: str, ref: dict):
+        with self._lock:
+            entries = self._entries.setdefault(token, OrderedDict())
+            entries[digest] = (ref, time.time())
+            entries.move_to_end(digest)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, token: str, digest: Optional[str] = None):
+        """Forget one file, or every file of a token (e.g. after its client is rebuilt)"""
+        with self._lock:
+            if digest is None:
+                self._entries.pop(token, None)
+            elif token in self._entries:
+                self._entries[token].pop(digest, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": sum(len(entries) for entries in self._entries.values())
+            }
+
+def tokens_from_env() -> List[str]:
+    # Get all possible HF tokens from environment
+    tokens = []
+    for i in range(1, 16):  # Check up to 15 tokens
+        token = os.getenv(f"HF{i}")
+        if token:
+            tokens.append(token)
+    return tokens
+
 class TokenManager:
-    def __init__(self):
-        # Get all possible HF tokens from environment
-        self.tokens = []
-        for i in range(1, 16):  # Check up to 15 tokens
-            token = os.getenv(f"HF{i}")
-            if token:
-                self.tokens.append(token)
-        
-        if not self.tokens:
-            raise ValueError("No valid tokens found in environment variables")
+    def __init__(self, tokens: Optional[List[str]] = None, client_factory: Optional[Callable] = None):
+        """
+        Nothing here touches the network: clients are built by
+        `initialize_clients` from the startup hook. Tests can pass their own
+        `tokens` and a fake `client_factory(token)`.
+        """
+        self.tokens = list(tokens) if tokens is not None else tokens_from_env()
+        self._client_factory = client_factory or default_client_factory
             
         self.clients = {}
         self.token_status = {}  # True = available, False = busy
         self.token_errors = {}  # Track errors per token
         self.token_quota_exceeded = {}  # Track quota issues
         self.current_operations = {}  # Track current operation per token
+        self.token_state = {token: TOKEN_INITIALIZING for token in self.tokens}
+        self.token_trips = {token: 0 for token in self.tokens}  # consecutive cooldowns/opens, for backoff
+        self.token_retry_at = {}  # token -> wall-clock time of the next half-open probe
+        self.token_latency_ewma: Dict[str, float] = {}  # token -> smoothed predict seconds
+        self._token_timers: Dict[str, asyncio.TimerHandle] = {}
         self.request_queue = asyncio.Queue()  # Queue for incoming requests
-        self.lock = asyncio.Lock()
-        self._last_used_token_index = -1  # For round-robin token selection
+        self._enqueued_seq = 0  # seq of the last job put on the queue
+        self._dequeued_seq = 0  # seq of the last job a worker took (the queue is FIFO)
+        # Idle, usable tokens in FIFO order (which gives round-robin selection).
+        # All token state is only touched from the event loop between awaits,
+        # so acquiring and releasing tokens needs no lock.
+        self._idle_tokens: asyncio.Queue = asyncio.Queue()
         self._processor_tasks: List[asyncio.Task] = []  # multiple workers
-        self.initialize_clients()
+        self._inflight: Dict[str, QueuedJob] = {}  # content hash -> shared job
+        self._inflight_waiters: Dict[str, int] = {}  # callers waiting on each shared future
+        self._init_task: Optional[asyncio.Task] = None
+        self._background_tasks: set = set()  # keeps re-initialization tasks alive
+        # Blocking client.predict calls run on their own pool, one thread per
+        # token, so GPU-bound work never queues behind the default executor
+        self._predict_workers = max(1, len(self.tokens))
+        self._predict_executor = ThreadPoolExecutor(
+            max_workers=self._predict_workers,
+            thread_name_prefix="hf-predict"
+        )
+        self._predict_stats_lock = threading.Lock()
+        self._predict_queued = 0
+        self._predict_active = 0
+        self._predict_completed = 0
+        self.jobs_skipped = 0  # dropped from the queue after their callers gave up
+        self.jobs_abandoned = 0  # predicts cancelled mid-flight
+        self.remote_files = RemoteFileCache()  # garments already uploaded, per token
+        for token in self.tokens:
+            self.token_status[token] = False  # not usable until its client is ready
+            self.token_errors[token] = 0
+            self.token_quota_exceeded[token] = False
+            self.current_operations[token] = None
         
+    async def shutdown(self):
+        """Stop the workers and release the predict threads"""
+        for task in self._processor_tasks:
+            task.cancel()
+        await asyncio.gather(*self._processor_tasks, return_exceptions=True)
+        self._processor_tasks.clear()
+        # Jobs nobody will pick up still own their input files
+        while not self.request_queue.empty():
+            job = self.request_queue.get_nowait()
+            if job.owns_inputs:
+                remove_files([job.vton_img_path, job.garm_img_path])
+        for timer in self._token_timers.values():
+            timer.cancel()
+        self._token_timers.clear()
+        self._predict_executor.shutdown(wait=False, cancel_futures=True)
+
     async def start_processor(self):
         """Start background workers equal to number of tokens"""
         for i in range(len(self.tokens)):
@@ -40,45 +249,109 @@ class TokenManager:
             self._processor_tasks.append(task)
             logger.info(f"Started worker {i} for token management")
         
-    def initialize_clients(self):
-        """Initialize clients for all tokens"""
-        for i, token in enumerate(self.tokens):
+    def start_initialization(self) -> asyncio.Task:
+        """Build all clients in the background; tokens go live as each one is ready"""
+        if not self.tokens:
+            raise ValueError("No valid tokens found in environment variables")
+        if self._init_task is None:
+            self._init_task = asyncio.create_task(self.initialize_clients())
+        return self._init_task
+
+    async def initialize_clients(self):
+        """Initialize clients for all tokens concurrently"""
+        await asyncio.gather(*(self._initialize_client(token) for token in self.tokens))
+        logger.info(f"Client initialization finished: {self.get_readiness()}")
+
+    async def _initialize_client(self, token: str):
+        """Build one client with retries, then hand its token to the idle pool"""
+        token_id = self.tokens.index(token) + 1
+        for attempt in range(1, HF_CLIENT_INIT_ATTEMPTS + 1):
             try:
-                client = Client("levihsu/OOTDiffusion", hf_token=token)
+                client = await asyncio.to_thread(self._client_factory, token)
                 self.clients[token] = client
-                self.token_status[token] = True  # Mark as available
-                self.token_errors[token] = 0  # Initialize error count
-                self.token_quota_exceeded[token] = False  # Initialize quota status
-                self.current_operations[token] = None  # No current operation
-                logger.info(f"Initialized client for token {i+1}")
+                self.remote_files.invalidate(token)
+                self.token_state[token] = TOKEN_CLOSED
+                self.token_errors[token] = 0
+                self.token_trips[token] = 0
+                self.token_retry_at.pop(token, None)
+                self._release_token(token)
+                logger.info(f"Initialized client for token {token_id}")
+                return
             except Exception as e:
-                logger.error(f"Failed to initialize client for token {i+1}: {str(e)}")
-                self.token_status[token] = False
-                self.token_errors[token] = 1
-                self.token_quota_exceeded[token] = False
+                logger.error(f"Failed to initialize client for token {token_id} (attempt {attempt}): {str(e)}")
+                if attempt < HF_CLIENT_INIT_ATTEMPTS:
+                    await asyncio.sleep(HF_CLIENT_INIT_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+        # Give up for now; the circuit timer retries initialization later
+        self.token_errors[token] = HF_ERROR_THRESHOLD
+        self._trip(token, TOKEN_OPEN, HF_CIRCUIT_OPEN_SECONDS, HF_CIRCUIT_OPEN_MAX_SECONDS)
+
+    def get_readiness(self) -> dict:
+        """Warm-up progress of the Gradio clients"""
+        ready = len(self.clients)
+        initializing = sum(1 for token in self.tokens if self.token_state.get(token) == TOKEN_INITIALIZING)
+        total = len(self.tokens)
+        return {
+            "ready": ready > 0,
+            "total_tokens": total,
+            "ready_tokens": ready,
+            "initializing_tokens": initializing,
+            "failed_tokens": total - ready - initializing,
+            "progress": round(ready / total, 2) if total else 0.0
+        }
                 
     async def _request_worker(self, worker_id: int):
-        """Each worker pulls requests and processes them concurrently"""
+        """
+        Each worker pulls requests and processes them concurrently.
+
+        Jobs whose callers all gave up, or whose deadline passed while queued,
+        are dropped without touching a token. A job abandoned mid-predict has
+        its predict cancelled so the token goes back to live requests.
+        """
         while True:
+            job = await self.request_queue.get()
+            self._dequeued_seq = max(self._dequeued_seq, job.seq)
+            STAGE_SECONDS.observe(time.monotonic() - job.enqueued_at, stage="queue_wait")
             try:
-                request_id, vton_path, garm_path, future = await self.request_queue.get()
-                logger.info(f"Worker {worker_id} picked request {request_id}")
-
-                result = await self._process_request(vton_path, garm_path)
+                if job.abandoned():
+                    self.jobs_skipped += 1
+                    logger.info(f"Worker {worker_id} skipped abandoned request {job.request_id}")
+                    if not job.future.done():
+                        job.future.set_exception(TimeoutError("Request deadline passed while queued"))
+                    continue
 
-                if not future.done():
-                    future.set_result(result)
+                logger.info(f"Worker {worker_id} picked request {job.request_id}")
+                predict = asyncio.create_task(self._process_request(job.vton_img_path, job.garm_img_path, job.deadline, job.garm_digest))
+                await asyncio.wait({predict, job.future}, return_when=asyncio.FIRST_COMPLETED)
 
-                self.request_queue.task_done()
+                if not predict.done():
+                    self.jobs_abandoned += 1
+                    logger.info(f"Worker {worker_id} abandoned request {job.request_id}, no caller is waiting")
+                    predict.cancel()
+                    await asyncio.gather(predict, return_exceptions=True)
+                elif not job.future.done():
+                    job.future.set_result(predict.result())
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Worker {worker_id} error: {str(e)}")
-                await asyncio.sleep(1)
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                if job.owns_inputs:
+                    remove_files([job.vton_img_path, job.garm_img_path])
+                self.request_queue.task_done()
     
-    async def _process_request(self, vton_img_path: str, garm_img_path: str) -> Optional[str]:
+    async def _process_request(self, vton_img_path: str, garm_img_path: str, deadline: Optional[float] = None, garm_digest: Optional[str] = None) -> Optional[str]:
         """Process a single request with proper token rotation"""
         # Try each available token once
         for attempt in range(len(self.tokens)):
-            token = await self._get_next_available_token()
+            remaining = deadline - time.time() if deadline is not None else 10.0
+            if remaining <= 0:
+                logger.error("Request deadline passed before a token was free")
+                return None
+
+            token = await self._get_next_available_token(timeout=min(10.0, remaining))
             if not token:
                 logger.error("No available tokens")
                 return None
@@ -86,108 +359,253 @@ class TokenManager:
             logger.info(f"Attempt {attempt + 1}: Processing with token {token[-10:]}...")
             
             try:
-                # Mark token as busy
-                async with self.lock:
-                    self.token_status[token] = False
-                    self.current_operations[token] = "processing"
+                self.current_operations[token] = "processing"
                 
                 client = self.clients[token]
-                result = await self._call_api_safe(client, vton_img_path, garm_img_path)
+                started = time.monotonic()
+                result = await self._call_api_safe(client, vton_img_path, garm_img_path, token, garm_digest)
                 
                 if result is not None:
                     # Success!
-                    async with self.lock:
-                        self.token_status[token] = True
-                        self.token_errors[token] = 0
-                        self.current_operations[token] = None
+                    self._record_latency(token, time.monotonic() - started)
+                    self.current_operations[token] = None
+                    self._record_success(token)
                     logger.info(f"Successfully processed with token {token[-10:]}...")
                     return result
                 else:
-                    # Mark token as quota exceeded and try next token
-                    async with self.lock:
-                        self.token_quota_exceeded[token] = True
-                        self.token_status[token] = False
-                        self.current_operations[token] = None
-                    logger.warning(f"Token {token[-10:]}... quota exceeded, trying next token")
+                    # No usable result; count it as an error and try next token
+                    self.current_operations[token] = None
+                    self._record_failure(token, quota=False)
+                    PROVIDER_FAILURES.inc(provider="space", reason="no_result")
+                    logger.warning(f"Token {token[-10:]}... returned no result, trying next token")
                     continue
+
+            except asyncio.CancelledError:
+                # Abandoned by the worker; the token did nothing wrong
+                self.current_operations[token] = None
+                self._release_token(token)
+                raise
                     
             except Exception as e:
                 logger.error(f"Error processing with token on attempt {attempt + 1}: {str(e)}")
                 
                 # Mark token based on error type
-                async with self.lock:
-                    if "quota" in str(e).lower() or "zerogpu" in str(e):
-                        self.token_quota_exceeded[token] = True
-                        self.token_status[token] = False
-                    else:
-                        self.token_errors[token] += 1
-                        if self.token_errors[token] >= 3:
-                            self.token_status[token] = False
-                        else:
-                            self.token_status[token] = True
-                    self.current_operations[token] = None
+                quota = "quota" in str(e).lower() or "zerogpu" in str(e)
+                self.current_operations[token] = None
+                self._record_failure(token, quota=quota)
+                PROVIDER_FAILURES.inc(provider="space", reason="quota" if quota else "error")
                 
                 # Continue to next token
                 continue
         
         logger.error("All tokens failed or have quota exceeded")
         return None
+
+    def _is_token_usable(self, token: str) -> bool:
+        return (token in self.clients and
+                self.token_state.get(token) in (TOKEN_CLOSED, TOKEN_HALF_OPEN))
+
+    def _record_success(self, token: str):
+        if self.token_state[token] == TOKEN_HALF_OPEN:
+            logger.info(f"Token {token[-10:]}... probe succeeded, closing circuit")
+        self.token_state[token] = TOKEN_CLOSED
+        self.token_errors[token] = 0
+        self.token_trips[token] = 0
+        self.token_quota_exceeded[token] = False
+        self.token_retry_at.pop(token, None)
+        self._release_token(token)
+
+    def _record_failure(self, token: str, quota: bool):
+        """Move a token to cooldown/open on failure, or hand it back if it is still healthy"""
+        if quota:
+            self.token_quota_exceeded[token] = True
+            self._trip(token, TOKEN_COOLDOWN, HF_QUOTA_COOLDOWN_SECONDS, HF_QUOTA_COOLDOWN_MAX_SECONDS)
+            return
+
+        self.token_errors[token] += 1
+        if self.token_state[token] == TOKEN_HALF_OPEN or self.token_errors[token] >= HF_ERROR_THRESHOLD:
+            self._trip(token, TOKEN_OPEN, HF_CIRCUIT_OPEN_SECONDS, HF_CIRCUIT_OPEN_MAX_SECONDS)
+        else:
+            self._release_token(token)
+
+    def _trip(self, token: str, state: str, base_delay: float, max_delay: float):
+        """Take a token out of rotation and schedule its half-open probe"""
+        self.token_trips[token] += 1
+        delay = min(base_delay * (2 ** (self.token_trips[token] - 1)), max_delay)
+
+        self.token_state[token] = state
+        self.token_status[token] = False
+        self.token_retry_at[token] = time.time() + delay
+
+        timer = self._token_timers.pop(token, None)
+        if timer:
+            timer.cancel()
+        self._token_timers[token] = asyncio.get_running_loop().call_later(delay, self._half_open, token)
+        logger.warning(f"Token {token[-10:]}... {state} for {delay:.0f}s (trip {self.token_trips[token]})")
+
+    def _half_open(self, token: str):
+        """Let one probe request through a cooled-down or open token"""
+        self._token_timers.pop(token, None)
+        if token not in self.clients:
+            # The client never came up; retry building it instead of probing
+            self.token_state[token] = TOKEN_INITIALIZING
+            self.token_retry_at.pop(token, None)
+            task = asyncio.create_task(self._initialize_client(token))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+            return
+        self.token_retry_at.pop(token, None)
+        self.token_state[token] = TOKEN_HALF_OPEN
+        self.token_quota_exceeded[token] = False
+        self.token_errors[token] = 0
+        logger.info(f"Token {token[-10:]}... half-open, next request is a probe")
+        self._release_token(token)
+
+    def next_token_retry_in(self) -> Optional[float]:
+        """Seconds until the next tripped token is probed again, if any"""
+        if not self.token_retry_at:
+            return None
+        return max(0.0, min(self.token_retry_at.values()) - time.time())
+
+    def _release_token(self, token: str):
+        """Hand a token back to the idle pool, waking one waiting acquirer"""
+        if self.token_status.get(token, False) or not self._is_token_usable(token):
+            return
+        self.token_status[token] = True
+        self._idle_tokens.put_nowait(token)
     
-    async def _get_next_available_token(self) -> Optional[str]:
-        """Get next available token using round-robin selection"""
-        start_time = time.time()
-        timeout = 10.0  # Wait up to 10 seconds for a token
-        
-        while time.time() - start_time < timeout:
-            async with self.lock:
-                # Get all available tokens
-                available_tokens = [
-                    token for token in self.tokens
-                    if (self.token_status.get(token, False) and 
-                        not self.token_quota_exceeded.get(token, False) and 
-                        self.token_errors.get(token, 0) < 3)
-                ]
-                
-                if available_tokens:
-                    # Use round-robin selection
-                    self._last_used_token_index = (self._last_used_token_index + 1) % len(available_tokens)
-                    selected_token = available_tokens[self._last_used_token_index]
-                    
-                    # Mark as busy immediately
-                    self.token_status[selected_token] = False
-                    return selected_token
-            
-            # If no token available, wait a bit
-            await asyncio.sleep(0.1)
-        
-        return None
+    async def _get_next_available_token(self, timeout: float = 10.0) -> Optional[str]:
+        """
+        Take the longest-idle usable token, waiting up to `timeout` seconds.
+
+        Released tokens are handed straight to the next waiter by the queue,
+        so there is no polling. Tokens that became unusable while idle are
+        dropped here.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                token = await asyncio.wait_for(self._idle_tokens.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return None
+
+            if self.token_status.get(token, False) and self._is_token_usable(token):
+                # Mark as busy immediately
+                self.token_status[token] = False
+                return token
+
+            self.token_status[token] = False
     
-    async def _call_api_safe(self, client, vton_img_path: str, garm_img_path: str) -> Optional[str]:
-        """Make API call with proper error handling"""
-        try:
-            loop = asyncio.get_event_loop()
-            
-            result = await loop.run_in_executor(
-                None, 
-                lambda: client.predict(
+    async def _call_api_safe(self, client, vton_img_path: str, garm_img_path: str, token: Optional[str] = None, garm_digest: Optional[str] = None) -> Optional[str]:
+        """
+        Make API call with proper error handling.
+
+        Uses `client.submit` rather than `predict` so that a cancelled call can
+        cancel the Space job: it is dropped from the Space queue if it has not
+        started, and the predict thread stops waiting for it either way.
+
+        With `token` and `garm_digest`, the garment is uploaded to the Space
+        once per token and the remote file is reused by later calls.
+        """
+        cancelled = threading.Event()
+        jobs = []
+        reuse_garment = token is not None and garm_digest is not None
+
+        def garment_file():
+            if not reuse_garment:
+                return handle_file(garm_img_path)
+            ref = self.remote_files.get(token, garm_digest)
+            if ref is None:
+                ref = upload_to_space(client, garm_img_path)
+                self.remote_files.set(token, garm_digest, ref)
+            return ref
+
+        def predict():
+            if cancelled.is_set():
+                return None
+            # Uploads plus the Space's own queue and inference
+            with STAGE_SECONDS.time(stage="predict"):
+                job = client.submit(
                     vton_img=handle_file(vton_img_path),
-                    garm_img=handle_file(garm_img_path),
+                    garm_img=garment_file(),
                     n_samples=1,
                     n_steps=20,  
                     image_scale=2,
                     seed=-1,
                     api_name="/process_hd"
                 )
-            )
+                jobs.append(job)
+                if cancelled.is_set():
+                    job.cancel()
+                return job.result()
+
+        try:
+            result = await self._run_predict(predict)
             
-            return await self._extract_result_path(result)
+            path = await self._extract_result_path(result)
+            if path is None and reuse_garment:
+                self.remote_files.invalidate(token, garm_digest)
+            return path
+
+        except asyncio.CancelledError:
+            cancelled.set()
+            for job in jobs:
+                job.cancel()
+            raise
             
         except Exception as e:
             logger.error(f"API call failed: {str(e)}")
             if "quota" in str(e).lower() or "zerogpu" in str(e):
                 raise Exception("Quota exceeded") from e
+            if reuse_garment:
+                # The Space may have restarted and lost the upload
+                self.remote_files.invalidate(token, garm_digest)
             return None
     
+    async def _run_predict(self, fn):
+        """Run a blocking predict on the dedicated pool, tracking queued/active threads"""
+        state = {"started": False, "cancelled": False}
+        with self._predict_stats_lock:
+            self._predict_queued += 1
+
+        def tracked():
+            with self._predict_stats_lock:
+                if state["cancelled"]:
+                    return None
+                state["started"] = True
+                self._predict_queued -= 1
+                self._predict_active += 1
+            try:
+                return fn()
+            finally:
+                with self._predict_stats_lock:
+                    self._predict_active -= 1
+                    self._predict_completed += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._predict_executor, tracked)
+        except asyncio.CancelledError:
+            with self._predict_stats_lock:
+                if not state["started"]:
+                    state["cancelled"] = True
+                    self._predict_queued -= 1
+            raise
+
+    def get_executor_stats(self) -> dict:
+        """Saturation of the predict pool"""
+        with self._predict_stats_lock:
+            return {
+                "max_workers": self._predict_workers,
+                "active": self._predict_active,
+                "queued": self._predict_queued,
+                "completed": self._predict_completed
+            }
+
     async def _extract_result_path(self, result) -> Optional[str]:
         """Extract image path from API result"""
         if not result:
@@ -216,65 +634,268 @@ class TokenManager:
             logger.error(f"Error extracting result path: {str(e)}")
             return str(result) if result else None
     
-    async def process_with_token(self, vton_img_path: str, garm_img_path: str) -> Optional[str]:
-        """Public method to process images - adds request to queue"""
-        request_id = f"req_{int(time.time() * 1000)}_{id(vton_img_path)}"
-        logger.info(f"Adding request {request_id} to queue")
-        
-        # Create a future for this request
-        future = asyncio.Future()
-        
-        # Add request to queue
-        await self.request_queue.put((request_id, vton_img_path, garm_img_path, future))
-        
+    @staticmethod
+    def _file_digest(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    async def content_key(self, vton_img_path: str, garm_img_path: str) -> str:
+        """Hash both inputs so identical submissions map to the same key"""
+        vton_digest, garm_digest = await asyncio.gather(
+            asyncio.to_thread(self._file_digest, vton_img_path),
+            asyncio.to_thread(self._file_digest, garm_img_path)
+        )
+        return f"{vton_digest}:{garm_digest}"
+
+    async def process_with_token(self, vton_img_path: str, garm_img_path: str, content_key: Optional[str] = None, deadline: Optional[float] = None, delete_inputs: bool = False) -> Optional[str]:
+        """
+        Public method to process images - adds request to queue.
+
+        Concurrent requests with the same content share one queued job, and so
+        one token and one `client.predict` call. `content_key` can be passed
+        when the caller already hashed the inputs, as
+        "<vton sha256>:<garment sha256>"; the garment half keys the reusable
+        garment upload. `deadline` is the absolute time.time() after which the
+        result is useless (default: now plus REQUEST_TIMEOUT_SECONDS).
+
+        When the last caller of a job times out or is cancelled (e.g. its
+        client disconnected), the job is failed so the worker skips it, or
+        cancels its predict if it already started.
+
+        With `delete_inputs` the caller hands over its input files: a new job
+        deletes them after its worker is done, so they outlive the caller if
+        others joined; a caller joining an existing job has its own copies
+        deleted at once. The caller must not delete them itself.
+        """
+        if deadline is None:
+            deadline = time.time() + REQUEST_TIMEOUT_SECONDS
+        if content_key is None:
+            try:
+                content_key = await self.content_key(vton_img_path, garm_img_path)
+            except BaseException:
+                if delete_inputs:
+                    remove_files([vton_img_path, garm_img_path])
+                raise
+
+        job = self._inflight.get(content_key)
+        if job is not None and not job.future.done():
+            logger.info(f"Joining in-flight request for {content_key[:12]}...")
+            CACHE_HITS.inc(cache="inflight")
+            # The job may now outlive the caller that created it; it owns its
+            # inputs, so they stay until the worker is done with it
+            job.deadline = max(job.deadline, deadline)
+            if delete_inputs:
+                remove_files([
+                    path for path in (vton_img_path, garm_img_path)
+                    if path not in (job.vton_img_path, job.garm_img_path)
+                ])
+        else:
+            CACHE_MISSES.inc(cache="inflight")
+            request_id = f"req_{int(time.time() * 1000)}_{id(vton_img_path)}"
+            logger.info(f"Adding request {request_id} to queue")
+
+            # Create a job shared by every caller with the same content
+            future = asyncio.get_running_loop().create_future()
+            self._enqueued_seq += 1
+            garm_digest = content_key.split(":", 1)[1] if ":" in content_key else None
+            job = QueuedJob(request_id, vton_img_path, garm_img_path, future, deadline, self._enqueued_seq, garm_digest, delete_inputs)
+            self._inflight[content_key] = job
+            future.add_done_callback(lambda f, key=content_key, job=job: self._forget_inflight(key, job))
+
+            # Add request to queue (unbounded, so this never waits and the
+            # job owns its inputs from here on)
+            self.request_queue.put_nowait(job)
+
+        future = job.future
+        self._inflight_waiters[content_key] = self._inflight_waiters.get(content_key, 0) + 1
         try:
-            # Wait for the result with a timeout
-            result = await asyncio.wait_for(future, timeout=120.0)
+            # Wait for the result until this caller's deadline; shield so one
+            # caller timing out does not cancel the job for the others
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - time.time()))
             return result
         except asyncio.TimeoutError:
-            logger.error(f"Request {request_id} timed out")
-            if not future.done():
+            logger.error(f"Request {content_key[:12]} timed out")
+            # Only fail the shared job once nobody else is waiting on it
+            if not future.done() and self._inflight_waiters.get(content_key, 0) <= 1:
                 future.set_exception(TimeoutError("Request timed out"))
             return None
+        except asyncio.CancelledError:
+            logger.info(f"Request {content_key[:12]} cancelled by its caller")
+            if not future.done() and self._inflight_waiters.get(content_key, 0) <= 1:
+                future.cancel()
+            raise
         except Exception as e:
-            logger.error(f"Request {request_id} failed: {str(e)}")
+            logger.error(f"Request {content_key[:12]} failed: {str(e)}")
             return None
+        finally:
+            waiters = self._inflight_waiters.get(content_key, 0) - 1
+            if waiters > 0:
+                self._inflight_waiters[content_key] = waiters
+            else:
+                self._inflight_waiters.pop(content_key, None)
+
+    def queue_position(self, content_key: str) -> dict:
+        """Where the job for `content_key` is: queued (with its 1-based position) or processing"""
+        job = self._inflight.get(content_key)
+        if job is None:
+            return {}
+        ahead = job.seq - self._dequeued_seq - 1
+        if ahead < 0:
+            return {"state": "processing", "queue_position": 0}
+        return {"state": "queued", "queue_position": ahead + 1}
+
+    def _forget_inflight(self, content_key: str, job: QueuedJob):
+        if self._inflight.get(content_key) is job:
+            del self._inflight[content_key]
+        # Mark the exception as retrieved for callers that already gave up
+        if not job.future.cancelled():
+            job.future.exception()
+
+    def _record_latency(self, token: str, seconds: float):
+        previous = self.token_latency_ewma.get(token)
+        if previous is None:
+            self.token_latency_ewma[token] = seconds
+        else:
+            self.token_latency_ewma[token] = HF_LATENCY_EWMA_ALPHA * seconds + (1 - HF_LATENCY_EWMA_ALPHA) * previous
+
+    def estimate_service_seconds(self) -> float:
+        """Mean smoothed predict latency over usable tokens"""
+        samples = [
+            self.token_latency_ewma[token] for token in self.tokens
+            if token in self.token_latency_ewma and self._is_token_usable(token)
+        ]
+        return sum(samples) / len(samples) if samples else HF_DEFAULT_SERVICE_SECONDS
+
+    def estimate_wait_seconds(self, batch_size: int = 1) -> Optional[float]:
+        """
+        Predicted seconds until a request submitted now has its result.
+
+        Jobs ahead of it are the queued ones plus those holding a token; with
+        `usable` tokens serving them in parallel, it starts after roughly
+        (ahead - usable + 1) / usable service times. For a batch of
+        `batch_size` jobs this is the wait of its last one. None when no
+        token is usable.
+        """
+        usable = self.get_usable_tokens_count()
+        if usable == 0:
+            return None
+
+        service = self.estimate_service_seconds()
+        idle = sum(1 for token in self.tokens if self.token_status.get(token, False))
+        ahead = self.request_queue.qsize() + max(0, usable - idle) + max(0, batch_size - 1)
+        queue_wait = max(0, ahead - usable + 1) / usable * service
+        return queue_wait + service
+
+    def admission_check(self, budget_seconds: float, batch_size: int = 1) -> dict:
+        """
+        Decide whether a request with `budget_seconds` left can finish in time,
+        or every job of a batch of `batch_size` can.
+
+        Returns {"admit", "estimated_wait_seconds", "retry_after_seconds"}; the
+        retry hint is how long the backlog needs to drain below the budget,
+        or the time until the next token probe when none is usable.
+        """
+        estimate = self.estimate_wait_seconds(batch_size)
+        if estimate is None:
+            retry_in = self.next_token_retry_in()
+            return {
+                "admit": False,
+                "estimated_wait_seconds": None,
+                "retry_after_seconds": max(1, math.ceil(retry_in)) if retry_in is not None else None
+            }
+
+        admit = estimate <= budget_seconds
+        return {
+            "admit": admit,
+            "estimated_wait_seconds": round(estimate, 1),
+            "retry_after_seconds": None if admit else max(1, math.ceil(estimate - budget_seconds))
+        }
 
     def get_usable_tokens_count(self) -> int:
-        """Get number of tokens that haven't exceeded quota"""
-        return sum(1 for token in self.tokens 
-                  if not self.token_quota_exceeded.get(token, False) 
-                  and self.token_errors.get(token, 0) < 3
-                  and self.token_status.get(token, False))
+        """Get number of tokens that are healthy or being probed (idle or busy)"""
+        return sum(1 for token in self.tokens if self._is_token_usable(token))
 
     def get_service_status(self) -> dict:
         """Get detailed service status"""
         usable_tokens = self.get_usable_tokens_count()
         total_tokens = len(self.tokens)
+        now = time.time()
         
         token_details = []
         for i, token in enumerate(self.tokens):
+            retry_at = self.token_retry_at.get(token)
             token_details.append({
                 "token_id": i + 1,
                 "status": "available" if self.token_status.get(token, False) else "busy",
+                "state": self.token_state.get(token),
                 "quota_exceeded": self.token_quota_exceeded.get(token, False),
                 "error_count": self.token_errors.get(token, 0),
+                "consecutive_trips": self.token_trips.get(token, 0),
+                "retry_in_seconds": round(max(0.0, retry_at - now), 1) if retry_at else None,
+                "latency_ewma_seconds": round(self.token_latency_ewma[token], 1) if token in self.token_latency_ewma else None,
                 "current_operation": self.current_operations.get(token),
-                "usable": (not self.token_quota_exceeded.get(token, False) and 
-                          self.token_errors.get(token, 0) < 3 and
-                          self.token_status.get(token, False))
+                "usable": self._is_token_usable(token)
             })
         
         queue_size = self.request_queue.qsize()
+        retry_in = self.next_token_retry_in()
+        estimated_wait = self.estimate_wait_seconds()
         
         return {
             "total_tokens": total_tokens,
             "usable_tokens": usable_tokens,
             "unusable_tokens": total_tokens - usable_tokens,
+            "available_tokens": sum(1 for token in self.tokens if self.token_status.get(token, False)),
             "queue_size": queue_size,
+            "next_token_retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+            "service_time_seconds": round(self.estimate_service_seconds(), 1),
+            "estimated_wait_seconds": round(estimated_wait, 1) if estimated_wait is not None else None,
             "service_status": "operational" if usable_tokens > 0 else "quota_exceeded",
+            "executor": self.get_executor_stats(),
+            "jobs_skipped": self.jobs_skipped,
+            "jobs_abandoned": self.jobs_abandoned,
+            "remote_files": self.remote_files.stats(),
             "token_details": token_details
         }
 
+def register_metrics(manager: TokenManager, target: Registry = registry):
+    """Export the queue and token state of `manager` on `target`, read at scrape time"""
+    def per_token(fn):
+        return lambda: {(str(i + 1),): fn(token) for i, token in enumerate(manager.tokens)}
+
+    target.register(Gauge(
+        "tryon_queue_depth",
+        "Jobs waiting for a token",
+        fn=lambda: {(): manager.request_queue.qsize()}
+    ))
+    target.register(Gauge(
+        "tryon_token_usable",
+        "1 when the token can take requests (healthy or probing)",
+        ("token_id",),
+        fn=per_token(lambda token: int(manager._is_token_usable(token)))
+    ))
+    target.register(Gauge(
+        "tryon_token_busy",
+        "1 while a usable token is held by a request",
+        ("token_id",),
+        fn=per_token(lambda token: int(manager._is_token_usable(token) and not manager.token_status.get(token, False)))
+    ))
+    target.register(Gauge(
+        "tryon_predict_threads",
+        "Predict pool threads running or waiting for a thread",
+        ("state",),
+        fn=lambda: {(state,): manager.get_executor_stats()[state] for state in ("active", "queued")}
+    ))
+    target.register(Counter(
+        "tryon_jobs_dropped_total",
+        "Jobs skipped while queued or cancelled mid-predict because nobody was waiting",
+        ("reason",),
+        fn=lambda: {("skipped",): manager.jobs_skipped, ("abandoned",): manager.jobs_abandoned}
+    ))
+
 # Global token manager instance
 token_manager = TokenManager()
+register_metrics(token_manager)
@@ -1,15 +1,22 @@
 import os
 import shutil
 import tempfile
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import Response, JSONResponse
+import time
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Request, Depends
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from PIL import Image
 import io
-from typing import Optional
+from typing import List, Optional
 import logging
 import asyncio
-from routers.token_manager import token_manager
+import math
+from routers.token_manager import token_manager, remove_files, REQUEST_TIMEOUT_SECONDS
+from utils.image_preprocess import preprocess_image
+from utils.uploads import ingest_upload, sniff_image_type, IngestedUpload, TRYON_BATCH_MAX_ITEMS
+from utils.metrics import STAGE_SECONDS
+from utils.jobs import job_store, require_job_store, Job, JOB_RUNNING, JOB_COMPLETED, JOB_FINISHED_STATES
 import base64
+import json
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +25,107 @@ router = APIRouter()
 # Allowed image formats
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS") or 1)
+
+# Non-standard status (as used by nginx) logged for requests whose client left
+CLIENT_CLOSED_REQUEST = 499
+
+class ClientDisconnected(Exception):
+    pass
+
+def request_deadline(x_request_deadline: Optional[float], x_request_timeout: Optional[float]) -> float:
+    """
+    Absolute time.time() deadline of a request.
+
+    The backend sends `X-Request-Deadline` (epoch seconds) so time already
+    spent upstream counts; `X-Request-Timeout` is a relative budget. Both are
+    capped at REQUEST_TIMEOUT_SECONDS from now.
+    """
+    now = time.time()
+    deadline = now + REQUEST_TIMEOUT_SECONDS
+    if x_request_timeout:
+        deadline = min(deadline, now + x_request_timeout)
+    if x_request_deadline:
+        deadline = min(deadline, x_request_deadline)
+    return deadline
+
+async def cancel_on_disconnect(request: Request, awaitable):
+    """Await `awaitable`, cancelling it and raising ClientDisconnected if the client goes away first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+def unavailable_error(status: dict) -> HTTPException:
+    """503 for when no token is usable, with Retry-After set to the next token probe"""
+    if token_manager.get_readiness()["initializing_tokens"] > 0:
+        return HTTPException(
+            status_code=503,
+            detail="Service is warming up. Please try again in a few seconds.",
+            headers={"Retry-After": "5"}
+        )
+
+    retry_in = status.get("next_token_retry_in_seconds")
+    headers = {"Retry-After": str(max(1, math.ceil(retry_in)))} if retry_in is not None else None
+    return HTTPException(
+        status_code=503,
+        detail="Service temporarily unavailable. All tokens are cooling down after GPU quota or errors. Please try again later.",
+        headers=headers
+    )
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Magic-byte signatures of the formats the Space can return
+def parse_accept(accept: str) -> List[tuple]:
+    """(media range, q) pairs of an Accept header; a malformed q counts as 0"""
+    ranges = []
+    for part in accept.split(","):
+        media_range, *params = [piece.strip() for piece in part.split(";")]
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media_range.lower(), q))
+    return ranges
+
+def accept_quality(ranges: List[tuple], media_type: str) -> float:
+    """q of `media_type` under its most specific matching range (type/sub, type/*, */*)"""
+    main_type = media_type.split("/")[0]
+    for candidate in (media_type, f"{main_type}/*", "*/*"):
+        matches = [q for media_range, q in ranges if media_range == candidate]
+        if matches:
+            return max(matches)
+    return 0.0
+
+def wants_binary_response(accept: Optional[str], media_type: str = "image/png") -> bool:
+    """
+    True when the caller prefers the raw `media_type` body to JSON/base64.
+
+    q=0 marks a type as not acceptable; JSON wins ties, so `*/*` and
+    clients without an Accept header keep getting JSON.
+    """
+    if not accept:
+        return False
+    ranges = parse_accept(accept)
+    image_q = accept_quality(ranges, media_type)
+    return image_q > 0 and image_q > accept_quality(ranges, "application/json")
+
 async def validate_image(content: bytes) -> bool:
     """Validate if the content is a valid image"""
     try:
@@ -30,73 +135,162 @@ async def validate_image(content: bytes) -> bool:
     except Exception:
         return False
 
-@router.post("/virtual-try-on")
-async def virtual_try_on_endpoint(
-    vton_image: UploadFile = File(..., description="Person image"),
-    garment_image: UploadFile = File(..., description="Garment image")
-):
+async def read_try_on_inputs(vton_image: UploadFile, garment_image: UploadFile):
     """
-    Virtual Try-On API Endpoint with Proper Request Queuing
+    Stream in and validate both uploads; returns (vton, garment) IngestedUploads.
+
+    Uploads are read in chunks, hashed and sniffed on the way, and rejected
+    as soon as they pass MAX_IMAGE_SIZE_MB or are not JPEG, PNG or WebP.
     """
-    logger.info("Received virtual try-on request")
-    
     # Validate file types
     if not allowed_file(vton_image.filename) or not allowed_file(garment_image.filename):
         raise HTTPException(
             status_code=400, 
             detail="Invalid file format. Only PNG, JPG, JPEG, and WEBP are allowed."
         )
+
+    vton = await ingest_upload(vton_image, "person image")
+    garment = await ingest_upload(garment_image, "garment image")
     
-    vton_temp_path = None
-    garment_temp_path = None
+    # Validate that files are actual images
+    with STAGE_SECONDS.time(stage="validation"):
+        valid = await validate_image(vton.data) and await validate_image(garment.data)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+
+    return vton, garment
+
+async def read_batch_inputs(vton_images: List[UploadFile], garment_images: List[UploadFile]):
+    """
+    Stream in and validate the uploads of a batch; returns (vtons, garments).
+
+    One side must hold a single image and the other at most
+    TRYON_BATCH_MAX_ITEMS, so the shared image is read and checked once.
+    """
+    if len(vton_images) != 1 and len(garment_images) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="A batch takes one person image with several garments, or several person images with one garment."
+        )
+    if max(len(vton_images), len(garment_images)) > TRYON_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch takes at most {TRYON_BATCH_MAX_ITEMS} images per side")
+
+    if not all(allowed_file(upload.filename) for upload in vton_images + garment_images):
+        raise HTTPException(
+            status_code=400, 
+            detail="Invalid file format. Only PNG, JPG, JPEG, and WEBP are allowed."
+        )
+
+    vtons = [await ingest_upload(upload, f"person image {i + 1}") for i, upload in enumerate(vton_images)]
+    garments = [await ingest_upload(upload, f"garment image {i + 1}") for i, upload in enumerate(garment_images)]
+
+    with STAGE_SECONDS.time(stage="validation"):
+        for upload in vtons + garments:
+            if not await validate_image(upload.data):
+                raise HTTPException(status_code=400, detail="Invalid image file")
+
+    return vtons, garments
+
+def admit_try_on(deadline: float, batch_size: int = 1):
+    """Raise 503 when no token is usable or the request (all `batch_size` jobs of it) cannot finish before `deadline`"""
+    # Check service status
+    service_status = token_manager.get_service_status()
+    if service_status["usable_tokens"] == 0:
+        raise unavailable_error(service_status)
     
+    # Admission control: shed requests that would not finish in their budget
+    budget = max(0.0, deadline - time.time())
+    admission = token_manager.admission_check(budget, batch_size)
+    if not admission["admit"]:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service is currently busy. Estimated wait is {admission['estimated_wait_seconds']}s, "
+                   f"more than the {budget:.0f}s allowed.",
+            headers={"Retry-After": str(admission["retry_after_seconds"])} if admission["retry_after_seconds"] else None
+        )
+
+    logger.info(f"Queueing request. Queue size: {service_status['queue_size']}, Usable tokens: {service_status['usable_tokens']}")
+
+async def preprocess_uploads(uploads: List[IngestedUpload]) -> List[bytes]:
+    """
+    Orient, downscale to the model resolution and re-encode uploads, in
+    order, so fewer bytes are uploaded to the Space by handle_file.
+    """
     try:
-        # Read and validate images
-        vton_content = await vton_image.read()
-        garment_content = await garment_image.read()
-        
-        # Validate that files are actual images
-        if not await validate_image(vton_content) or not await validate_image(garment_content):
-            raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Check service status
-        service_status = token_manager.get_service_status()
-        if service_status["usable_tokens"] == 0:
-            raise HTTPException(
-                status_code=503,
-                detail="Service temporarily unavailable. All tokens have exceeded daily GPU quota. Please try again in 24 hours."
-            )
-        
-        # Check queue size
-        if service_status["queue_size"] > 10:  # Increased queue limit
-            raise HTTPException(
-                status_code=503,
-                detail="Service is currently busy. Please try again in a few minutes."
-            )
-        
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as vton_temp:
-            vton_temp.write(vton_content)
-            vton_temp_path = vton_temp.name
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as garment_temp:
-            garment_temp.write(garment_content)
-            garment_temp_path = garment_temp.name
-        
-        logger.info(f"Queueing request. Queue size: {service_status['queue_size']}, Usable tokens: {service_status['usable_tokens']}")
-        
+        processed = await asyncio.gather(*(preprocess_image(upload.data) for upload in uploads))
+    except Exception as e:
+        logger.error(f"Preprocessing uploads failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error. Please try again later."
+        )
+    return [data for data, _ in processed]
+
+def write_temp_files(contents: List[bytes]) -> List[str]:
+    """Write each of `contents` to a temporary .jpg; returns their paths"""
+    paths = []
+    try:
+        for data in contents:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
+                paths.append(temp.name)
+                temp.write(data)
+        return paths
+    except Exception as e:
+        remove_files(paths)
+        logger.error(f"Writing temporary files failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error. Please try again later."
+        )
+
+async def run_try_on(vton: IngestedUpload, garment: IngestedUpload, deadline: float, job: Optional[Job] = None):
+    """
+    Preprocess, queue and wait for one try-on; shared by the blocking and job endpoints.
+
+    Returns (image_data, None) on success, or (None, info) when the Space
+    answered with something that is not an image. Failures raise
+    HTTPException. With `job`, its progress follows the request through the
+    token queue.
+    """
+    vton_upload, garment_upload = await preprocess_uploads([vton, garment])
+    return await process_try_on(vton_upload, garment_upload, vton.sha256, garment.sha256, deadline, job)
+
+async def process_try_on(vton_upload: bytes, garment_upload: bytes, vton_digest: str, garment_digest: str, deadline: float, job: Optional[Job] = None):
+    """
+    Queue preprocessed images for a token and extract the result; returns as run_try_on.
+
+    The temporary files are handed to the token manager, which deletes them
+    once the (possibly shared) queued job no longer needs them.
+    """
+    # Identical submissions share one queued job (and one token); the
+    # digests were computed while the uploads were read
+    content_key = f"{vton_digest}:{garment_digest}"
+    try:
+        if job is not None:
+            job.progress_fn = lambda: token_manager.queue_position(content_key)
+            job.update(JOB_RUNNING)
+
+        # Written right before queueing, with no await in between, so a
+        # cancelled caller cannot leave them behind
+        vton_path, garment_path = write_temp_files([vton_upload, garment_upload])
+
         # Process images with token rotation (this will queue the request)
-        result = await token_manager.process_with_token(vton_temp_path, garment_temp_path)
+        result = await token_manager.process_with_token(
+            vton_path,
+            garment_path,
+            content_key=content_key,
+            deadline=deadline,
+            delete_inputs=True
+        )
 
         if not result:
             # Check current status
             current_status = token_manager.get_service_status()
             
             if current_status["usable_tokens"] == 0:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Service temporarily unavailable due to quota limitations. Please try again tomorrow."
-                )
+                raise unavailable_error(current_status)
+            elif time.time() >= deadline:
+                raise asyncio.TimeoutError()
             else:
                 # More specific error message
                 raise HTTPException(
@@ -105,25 +299,21 @@ async def virtual_try_on_endpoint(
                 )
 
         # Handle the result
-        image_data = await extract_image_data(result)
+        with STAGE_SECONDS.time(stage="result_extraction"):
+            image_data = await extract_image_data(result)
         
         if image_data:
             logger.info("Virtual try-on completed successfully")
-            encoded_image = base64.b64encode(image_data).decode("utf-8")
-            return JSONResponse({"status": "ok", "image_base64": encoded_image})
+            return image_data, None
         
-        else:
-            # If we can't extract image data but have a result, try to return it as JSON
-            logger.warning("Could not extract image data, returning result info")
-            return JSONResponse(
-                content={
-                    "status": "processed",
-                    "message": "Processing completed but could not extract image",
-                    "result_type": str(type(result)),
-                    "result_preview": str(result)[:200] if result else "None"
-                },
-                status_code=200
-            )
+        # If we can't extract image data but have a result, try to return it as JSON
+        logger.warning("Could not extract image data, returning result info")
+        return None, {
+            "status": "processed",
+            "message": "Processing completed but could not extract image",
+            "result_type": str(type(result)),
+            "result_preview": str(result)[:200] if result else "None"
+        }
 
     except asyncio.TimeoutError:
         logger.error("Request timed out")
@@ -131,7 +321,7 @@ async def virtual_try_on_endpoint(
             status_code=504,
             detail="Request timeout. The service is currently busy. Please try again."
         )
-    except HTTPException:
+    except (HTTPException, asyncio.CancelledError):
         raise
     except Exception as e:
         logger.error(f"Unexpected error during processing: {str(e)}")
@@ -139,12 +329,190 @@ async def virtual_try_on_endpoint(
             status_code=500,
             detail="Internal server error. Please try again later."
         )
-    finally:
-        # Clean up temporary files
-        if vton_temp_path and os.path.exists(vton_temp_path):
-            os.unlink(vton_temp_path)
-        if garment_temp_path and os.path.exists(garment_temp_path):
-            os.unlink(garment_temp_path)
+
+def try_on_response(image_data: Optional[bytes], info: Optional[dict], accept: Optional[str], extra: Optional[dict] = None):
+    """Raw image for `Accept: image/*` callers, JSON with base64 otherwise"""
+    if not image_data:
+        return JSONResponse(content={**(extra or {}), **info}, status_code=200)
+    media_type = sniff_image_type(image_data) or "application/octet-stream"
+    if wants_binary_response(accept, media_type):
+        return Response(
+            content=image_data,
+            media_type=media_type,
+            headers={
+                "X-TryOn-Status": "ok",
+                "X-TryOn-Image-Bytes": str(len(image_data))
+            }
+        )
+    with STAGE_SECONDS.time(stage="base64_encode"):
+        encoded_image = base64.b64encode(image_data).decode("utf-8")
+    return JSONResponse({**(extra or {}), "status": "ok", "image_base64": encoded_image})
+
+@router.post("/virtual-try-on")
+async def virtual_try_on_endpoint(
+    request: Request,
+    vton_image: UploadFile = File(..., description="Person image"),
+    garment_image: UploadFile = File(..., description="Garment image"),
+    accept: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None),
+    x_request_deadline: Optional[float] = Header(None)
+):
+    """
+    Virtual Try-On API Endpoint with Proper Request Queuing
+
+    Callers sending `Accept: image/*` get the raw image as the response body
+    with metadata in `X-TryOn-*` headers; everyone else gets the JSON form
+    with the image base64-encoded.
+
+    The queued job carries the request deadline, and is dropped (or its
+    predict cancelled) once the deadline passes or the client disconnects.
+    """
+    logger.info("Received virtual try-on request")
+    
+    vton, garment = await read_try_on_inputs(vton_image, garment_image)
+    deadline = request_deadline(x_request_deadline, x_request_timeout)
+    admit_try_on(deadline)
+
+    try:
+        image_data, info = await cancel_on_disconnect(
+            request, run_try_on(vton, garment, deadline)
+        )
+    except ClientDisconnected:
+        logger.info("Client disconnected, abandoned its try-on request")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
+    return try_on_response(image_data, info, accept)
+
+@router.post("/virtual-try-on/jobs", status_code=202, dependencies=[Depends(require_job_store)])
+async def submit_try_on_job(
+    vton_image: UploadFile = File(..., description="Person image"),
+    garment_image: UploadFile = File(..., description="Garment image"),
+    x_request_timeout: Optional[float] = Header(None),
+    x_request_deadline: Optional[float] = Header(None)
+):
+    """
+    Submit a try-on without holding the connection open.
+
+    Returns a job id at once; poll `GET /virtual-try-on/jobs/{job_id}` or
+    follow `GET /virtual-try-on/jobs/{job_id}/events` (server-sent events).
+    """
+    vton, garment = await read_try_on_inputs(vton_image, garment_image)
+    deadline = request_deadline(x_request_deadline, x_request_timeout)
+    admit_try_on(deadline)
+
+    job = job_store.submit(lambda job: run_try_on(vton, garment, deadline, job))
+    logger.info(f"Submitted try-on job {job.id}")
+    return {
+        **job.snapshot(),
+        "status_url": f"/api/virtual-try-on/jobs/{job.id}",
+        "events_url": f"/api/virtual-try-on/jobs/{job.id}/events"
+    }
+
+@router.post("/virtual-try-on/batch")
+async def batch_try_on_endpoint(
+    vton_images: List[UploadFile] = File(..., description="Person image(s)"),
+    garment_images: List[UploadFile] = File(..., description="Garment image(s)"),
+    x_request_timeout: Optional[float] = Header(None),
+    x_request_deadline: Optional[float] = Header(None)
+):
+    """
+    Try one person on several garments, or several persons on one garment.
+
+    Every image is preprocessed once and all pairs are queued together, so
+    free tokens work on them in parallel. Results stream back as NDJSON in
+    completion order, one line per pair: `index`, `vton_index` and
+    `garment_index`, then either `status: "ok"` with `image_base64`, or
+    `status: "error"` with `status_code` and `detail`. A client that
+    disconnects cancels the pairs still pending.
+    """
+    vtons, garments = await read_batch_inputs(vton_images, garment_images)
+    pairs = [(v, g) for v in range(len(vtons)) for g in range(len(garments))]
+    deadline = request_deadline(x_request_deadline, x_request_timeout)
+    admit_try_on(deadline, len(pairs))
+    logger.info(f"Received batch try-on of {len(pairs)} pairs")
+
+    # Repeated images (the shared one above all) are preprocessed only once;
+    # each pair still gets its own temp files, owned by its queued job
+    unique = {upload.sha256: upload for upload in vtons + garments}
+    processed = dict(zip(unique, await preprocess_uploads(list(unique.values()))))
+
+    async def batch_results():
+        tasks = {}
+        try:
+            for index, (v, g) in enumerate(pairs):
+                vton, garment = vtons[v], garments[g]
+                task = asyncio.create_task(process_try_on(
+                    processed[vton.sha256],
+                    processed[garment.sha256],
+                    vton.sha256,
+                    garment.sha256,
+                    deadline
+                ))
+                tasks[task] = {"index": index, "vton_index": v, "garment_index": g}
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield batch_line(tasks[task], task)
+        finally:
+            # Reached when the client disconnects as well
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StreamingResponse(
+        batch_results(),
+        media_type="application/x-ndjson",
+        headers={"X-TryOn-Batch-Size": str(len(pairs)), "X-Accel-Buffering": "no"}
+    )
+
+def batch_line(item: dict, task: asyncio.Task) -> str:
+    """One NDJSON line for a finished pair of a batch"""
+    try:
+        image_data, info = task.result()
+    except HTTPException as e:
+        return json.dumps({**item, "status": "error", "status_code": e.status_code, "detail": e.detail}) + "\n"
+
+    if not image_data:
+        return json.dumps({**item, **info}) + "\n"
+    with STAGE_SECONDS.time(stage="base64_encode"):
+        encoded_image = base64.b64encode(image_data).decode("utf-8")
+    return json.dumps({**item, "status": "ok", "image_base64": encoded_image}) + "\n"
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@router.get("/virtual-try-on/jobs/{job_id}", dependencies=[Depends(require_job_store)])
+async def get_try_on_job(job_id: str, accept: Optional[str] = Header(None)):
+    """Status of a job; once completed, the result in the same forms as /virtual-try-on"""
+    job = get_job_or_404(job_id)
+    if job.status != JOB_COMPLETED:
+        return job.snapshot()
+
+    image_data, info = job.result
+    return try_on_response(image_data, info, accept, extra={"job_id": job.id})
+
+@router.get("/virtual-try-on/jobs/{job_id}/events", dependencies=[Depends(require_job_store)])
+async def try_on_job_events(job_id: str):
+    """Server-sent `status` events with the queue position, then a final completed/failed/cancelled event"""
+    job = get_job_or_404(job_id)
+    return StreamingResponse(
+        job_store.events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/virtual-try-on/jobs/{job_id}", dependencies=[Depends(require_job_store)])
+async def cancel_try_on_job(job_id: str):
+    """Cancel a job; a queued predict is skipped and a running one abandoned"""
+    job = job_store.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {"job_id": job.id, "status": "cancelling" if job.status not in JOB_FINISHED_STATES else job.status}
 
 async def extract_image_data(result) -> Optional[bytes]:
     """Extract image data from various possible result formats"""
@@ -190,6 +558,8 @@ async def get_token_status():
     response = {
         "service_status": status["service_status"],
         "queue_size": status["queue_size"],
+        "estimated_wait_seconds": status["estimated_wait_seconds"],
+        "service_time_seconds": status["service_time_seconds"],
         "tokens": {
             "total": status["total_tokens"],
             "usable": status["usable_tokens"],
@@ -200,11 +570,12 @@ async def get_token_status():
     
     # Add advice based on status
     if status["usable_tokens"] == 0:
-        response["message"] = "All tokens have exceeded daily quota. Service will resume in 24 hours."
+        response["message"] = "All tokens are cooling down after GPU quota or errors."
+        response["retry_in_seconds"] = status["next_token_retry_in_seconds"]
         response["suggestion"] = "Add more Hugging Face tokens to increase capacity."
     elif status["queue_size"] > 0:
         response["message"] = f"Service operational. {status['queue_size']} requests in queue."
-        response["estimated_wait"] = f"Approx {status['queue_size'] * 20} seconds"
+        response["estimated_wait"] = f"Approx {status['estimated_wait_seconds']} seconds"
     else:
         response["message"] = "Service ready and waiting for requests."
     
@@ -221,6 +592,7 @@ async def get_queue_info():
             op for op in [token_manager.current_operations.get(token) 
                          for token in token_manager.tokens] if op
         ],
-        "estimated_wait_time_seconds": status["queue_size"] * 20,
+        "estimated_wait_time_seconds": status["estimated_wait_seconds"],
+        "service_time_seconds": status["service_time_seconds"],
         "service_capacity": f"{status['usable_tokens']} concurrent operations"
     }
\ No newline at end of file
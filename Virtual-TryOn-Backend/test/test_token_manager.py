@@ -0,0 +1,355 @@
+from routers import token_manager as token_manager_module
+from routers.token_manager import TokenManager, TOKEN_OPEN, TOKEN_HALF_OPEN, TOKEN_CLOSED
+from routers import virtual_try_on
+from fastapi import HTTPException
+from utils.metrics import Registry, STAGE_SECONDS
+import asyncio
+import os
+import concurrent.futures
+import pytest
+import threading
+import time
+
+class FakeJob:
+    """Stands in for gradio_client.Job"""
+
+    def __init__(self, client):
+        self.client = client
+        self.cancelled = threading.Event()
+
+    def result(self):
+        client = self.client
+        with client.lock:
+            client.active += 1
+            client.max_active = max(client.max_active, client.active)
+            failing = client.calls <= client.failures
+        try:
+            if self.cancelled.wait(client.delay):
+                raise concurrent.futures.CancelledError()
+            if failing:
+                raise RuntimeError("Space error")
+            return [{"image": client.result_path}]
+        finally:
+            with client.lock:
+                client.active -= 1
+
+    def cancel(self):
+        self.cancelled.set()
+        self.client.cancels += 1
+        return True
+
+class FakeClient:
+    """
+    Stands in for gradio_client.Client; returns a result file without network.
+
+    The first `failures` calls raise, as a broken Space would; `max_active`
+    is the most calls that were ever in flight at once.
+    """
+
+    def __init__(self, token, result_path, delay=0.05, failures=0):
+        self.token = token
+        self.result_path = result_path
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self.cancels = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def submit(self, **kwargs):
+        self.calls += 1
+        return FakeJob(self)
+
+@pytest.fixture(autouse=True)
+def no_space_uploads(monkeypatch):
+    """Garment uploads go to the Space over HTTP; hand back the local path instead"""
+    monkeypatch.setattr(token_manager_module, "upload_to_space", lambda client, path: {"path": path})
+
+def make_inputs(tmp_path):
+    result = tmp_path / "result.png"
+    result.write_bytes(b"result")
+    vton = tmp_path / "vton.jpg"
+    vton.write_bytes(b"vton")
+    garment = tmp_path / "garment.jpg"
+    garment.write_bytes(b"garment")
+    return str(result), str(vton), str(garment)
+
+def test_clients_are_built_at_startup_not_import(tmp_path):
+    result, vton, garment = make_inputs(tmp_path)
+    built = []
+
+    def factory(token):
+        built.append(token)
+        return FakeClient(token, result)
+
+    manager = TokenManager(tokens=["tok1", "tok2"], client_factory=factory)
+    assert built == []
+    assert manager.get_readiness()["ready"] is False
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        return await manager.process_with_token(vton, garment)
+
+    assert asyncio.run(run()) == result
+    assert sorted(built) == ["tok1", "tok2"]
+    assert manager.get_readiness()["ready_tokens"] == 2
+
+def test_identical_requests_share_one_predict(tmp_path):
+    result, vton, garment = make_inputs(tmp_path)
+    clients = {}
+
+    def factory(token):
+        clients[token] = FakeClient(token, result, delay=0.2)
+        return clients[token]
+
+    manager = TokenManager(tokens=["tok1", "tok2"], client_factory=factory)
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        return await asyncio.gather(*(manager.process_with_token(vton, garment) for _ in range(4)))
+
+    assert asyncio.run(run()) == [result] * 4
+    assert sum(client.calls for client in clients.values()) == 1
+
+def test_expired_queued_job_is_skipped(tmp_path):
+    result, vton, garment = make_inputs(tmp_path)
+    other = tmp_path / "other.jpg"
+    other.write_bytes(b"other")
+    clients = {}
+
+    def factory(token):
+        clients[token] = FakeClient(token, result, delay=0.3)
+        return clients[token]
+
+    manager = TokenManager(tokens=["tok1"], client_factory=factory)
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        first = asyncio.create_task(manager.process_with_token(vton, garment))
+        await asyncio.sleep(0.05)
+        # Queued behind the first job and expires long before the token is free
+        expired = await manager.process_with_token(str(other), garment, deadline=time.time() + 0.1)
+        return await first, expired
+
+    assert asyncio.run(run()) == (result, None)
+    assert clients["tok1"].calls == 1
+    assert manager.jobs_skipped == 1
+
+def test_cancelled_caller_cancels_running_predict(tmp_path):
+    result, vton, garment = make_inputs(tmp_path)
+    clients = {}
+
+    def factory(token):
+        clients[token] = FakeClient(token, result, delay=5)
+        return clients[token]
+
+    manager = TokenManager(tokens=["tok1"], client_factory=factory)
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        caller = asyncio.create_task(manager.process_with_token(vton, garment))
+        await asyncio.sleep(0.1)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert clients["tok1"].cancels == 1
+    assert manager.jobs_abandoned == 1
+    assert manager.token_status["tok1"] is True
+
+def test_garment_is_uploaded_once_per_token(tmp_path, monkeypatch):
+    result, vton, garment = make_inputs(tmp_path)
+    uploads = []
+
+    def fake_upload(client, path):
+        uploads.append((client.token, path))
+        return {"path": f"/remote/{len(uploads)}", "orig_name": "garment.jpg"}
+
+    monkeypatch.setattr(token_manager_module, "upload_to_space", fake_upload)
+    manager = TokenManager(tokens=["tok1"], client_factory=lambda token: FakeClient(token, result))
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        # Different people, same garment
+        return [
+            await manager.process_with_token(vton, garment, content_key=f"person{i}:garment")
+            for i in range(3)
+        ]
+
+    assert asyncio.run(run()) == [result] * 3
+    assert uploads == [("tok1", garment)]
+    assert manager.remote_files.stats()["hits"] == 2
+
+def test_metrics_cover_queue_wait_predict_and_tokens(tmp_path):
+    result, vton, garment = make_inputs(tmp_path)
+    manager = TokenManager(tokens=["tok1"], client_factory=lambda token: FakeClient(token, result))
+    # A fresh registry, so the gauges of the global token manager stay in place
+    metrics = Registry()
+    token_manager_module.register_metrics(manager, metrics)
+    before = STAGE_SECONDS.samples()
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        return await manager.process_with_token(vton, garment)
+
+    assert asyncio.run(run()) == result
+
+    def count(samples, stage):
+        return sum(value for suffix, _, labels, value in samples if suffix == "_count" and labels == (stage,))
+
+    after = STAGE_SECONDS.samples()
+    assert count(after, "queue_wait") == count(before, "queue_wait") + 1
+    assert count(after, "predict") == count(before, "predict") + 1
+
+    text = metrics.render()
+    assert 'tryon_token_usable{token_id="1"} 1' in text
+    assert 'tryon_token_busy{token_id="1"} 0' in text
+    assert "tryon_queue_depth 0" in text
+    assert 'tryon_stage_duration_seconds_bucket{stage="predict",le="+Inf"}' in STAGE_SECONDS.render()
+
+def owned_copies(tmp_path, name):
+    """Fresh input files for a caller that hands them over with delete_inputs"""
+    vton = tmp_path / f"{name}_vton.jpg"
+    vton.write_bytes(b"vton")
+    garment = tmp_path / f"{name}_garment.jpg"
+    garment.write_bytes(b"garment")
+    return str(vton), str(garment)
+
+def run_behind_busy_token(tmp_path, first_caller):
+    """
+    Queue a shared job behind a running one; `first_caller(manager, vton,
+    garment)` creates it and gives up, then a second caller joins.
+    """
+    result, vton, garment = make_inputs(tmp_path)
+    manager = TokenManager(tokens=["tok1"], client_factory=lambda token: FakeClient(token, result, delay=0.3))
+    first = owned_copies(tmp_path, "first")
+    second = owned_copies(tmp_path, "second")
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        blocker = asyncio.create_task(manager.process_with_token(vton, garment))
+        await asyncio.sleep(0.05)
+        leaving = asyncio.create_task(first_caller(manager, *first))
+        await asyncio.sleep(0.05)
+        joined = await manager.process_with_token(
+            *second, content_key="shared", deadline=time.time() + 5, delete_inputs=True
+        )
+        await blocker
+        return await asyncio.gather(leaving, return_exceptions=True), joined
+
+    (left,), joined = asyncio.run(run())
+    return manager, left, joined, first + second, result
+
+def test_joiner_gets_result_after_first_caller_is_cancelled(tmp_path):
+    async def cancelled_caller(manager, vton, garment):
+        task = asyncio.create_task(manager.process_with_token(
+            vton, garment, content_key="shared", deadline=time.time() + 5, delete_inputs=True
+        ))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return await task
+
+    manager, left, joined, files, result = run_behind_busy_token(tmp_path, cancelled_caller)
+    assert isinstance(left, asyncio.CancelledError)
+    assert joined == result
+    assert manager.token_errors["tok1"] == 0
+    # The job deleted the inputs it owned once it was done with them
+    assert not any(os.path.exists(path) for path in files)
+
+def test_joiner_gets_result_after_first_caller_times_out(tmp_path):
+    async def impatient_caller(manager, vton, garment):
+        return await manager.process_with_token(
+            vton, garment, content_key="shared", deadline=time.time() + 0.1, delete_inputs=True
+        )
+
+    manager, left, joined, files, result = run_behind_busy_token(tmp_path, impatient_caller)
+    assert left is None
+    assert joined == result
+    assert manager.token_errors["tok1"] == 0
+    assert not any(os.path.exists(path) for path in files)
+
+def test_circuit_opens_then_probes_then_closes(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_manager_module, "HF_ERROR_THRESHOLD", 1)
+    monkeypatch.setattr(token_manager_module, "HF_CIRCUIT_OPEN_SECONDS", 0.2)
+    result, vton, garment = make_inputs(tmp_path)
+    manager = TokenManager(tokens=["tok1"], client_factory=lambda token: FakeClient(token, result, failures=1))
+    states = []
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        failed = await manager.process_with_token(vton, garment)
+        states.append((manager.token_state["tok1"], manager.get_usable_tokens_count()))
+
+        await asyncio.sleep(0.3)
+        states.append((manager.token_state["tok1"], manager.get_usable_tokens_count()))
+
+        # The probe succeeds and closes the circuit again
+        probed = await manager.process_with_token(vton, garment)
+        states.append((manager.token_state["tok1"], manager.get_usable_tokens_count()))
+        return failed, probed
+
+    assert asyncio.run(run()) == (None, result)
+    assert states == [(TOKEN_OPEN, 0), (TOKEN_HALF_OPEN, 1), (TOKEN_CLOSED, 1)]
+    assert manager.token_errors["tok1"] == 0
+    assert manager.token_trips["tok1"] == 0
+
+def test_busy_service_answers_503_with_retry_after(tmp_path, monkeypatch):
+    result, vton, garment = make_inputs(tmp_path)
+    manager = TokenManager(tokens=["tok1"], client_factory=lambda token: FakeClient(token, result, delay=0.3))
+    monkeypatch.setattr(virtual_try_on, "token_manager", manager)
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        # Seeds the latency EWMA with the measured ~0.3s predict
+        return await manager.process_with_token(vton, garment)
+
+    assert asyncio.run(run()) == result
+    assert manager.estimate_wait_seconds() >= 0.3
+
+    with pytest.raises(HTTPException) as error:
+        virtual_try_on.admit_try_on(time.time() + 0.1)
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "1"}
+
+    # A deadline the estimate fits in is admitted
+    virtual_try_on.admit_try_on(time.time() + 5)
+
+def test_token_is_never_handed_to_two_requests_at_once(tmp_path):
+    result, _, garment = make_inputs(tmp_path)
+    clients = {}
+
+    def factory(token):
+        # tok2 fails its first call, so it is also handed back after an error
+        clients[token] = FakeClient(token, result, delay=0.05, failures=1 if token == "tok2" else 0)
+        return clients[token]
+
+    manager = TokenManager(tokens=["tok1", "tok2"], client_factory=factory)
+
+    async def run():
+        await manager.start_processor()
+        await manager.start_initialization()
+        # A duplicate release of an idle token (e.g. from a stray probe timer)
+        manager._release_token("tok1")
+        requests = []
+        for i in range(12):
+            vton = tmp_path / f"vton_{i}.jpg"
+            vton.write_bytes(f"vton {i}".encode())
+            requests.append(manager.process_with_token(str(vton), garment))
+        return await asyncio.gather(*requests)
+
+    assert asyncio.run(run()) == [result] * 12
+    assert sum(client.calls for client in clients.values()) == 13
+    assert [client.max_active for client in clients.values()] == [1, 1]
+    # Every token is back in the idle pool exactly once
+    assert sorted(manager._idle_tokens._queue) == ["tok1", "tok2"]
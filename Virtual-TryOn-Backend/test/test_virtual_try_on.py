@@ -0,0 +1,18 @@
+from routers import virtual_try_on
+import pytest
+
+@pytest.mark.parametrize("accept, binary", [
+    (None, False),
+    ("application/json", False),
+    ("image/png", True),
+    ("image/*", True),
+    ("*/*", False),
+    ("application/json, image/*;q=0", False),
+    ("image/png;q=0, image/*", False),
+    ("image/png, application/json", False),
+    ("image/png, application/json;q=0.5", True),
+    ("application/json;q=0.8, image/*;q=0.9", True),
+    ("image/png;q=oops", False),
+])
+def test_binary_response_follows_accept_q_values(accept, binary):
+    assert virtual_try_on.wants_binary_response(accept, "image/png") is binary
@@ -0,0 +1,72 @@
+# Shared by backend/utils and Virtual-TryOn-Backend/utils; keep both copies
+# identical (checked by backend/test/test_shared_utils.py)
+import os
+import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+from PIL import Image, ImageOps
+from utils.metrics import STAGE_SECONDS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# OOTDiffusion works on 768x1024 (HD) inputs; anything larger is thrown away
+# by the model, so downscale before the bytes leave this service.
+PREPROCESS_MAX_WIDTH = int(os.getenv("PREPROCESS_MAX_WIDTH") or 768)
+PREPROCESS_MAX_HEIGHT = int(os.getenv("PREPROCESS_MAX_HEIGHT") or 1024)
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY") or 90)
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS") or min(4, os.cpu_count() or 1))
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+_executor = ThreadPoolExecutor(
+    max_workers=PREPROCESS_WORKERS,
+    thread_name_prefix="image-preprocess"
+)
+
+def normalise_image(data: bytes) -> Tuple[bytes, str]:
+    """
+    Apply EXIF orientation, fit within the model resolution and re-encode as JPEG.
+
+    Inputs that are already upright JPEGs within the bounds are returned
+    unchanged so re-running the stage (e.g. in the worker after the backend)
+    costs only a header parse. Returns (image_bytes, media_type).
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        if (
+            image.format == "JPEG"
+            and orientation == 1
+            and image.width <= PREPROCESS_MAX_WIDTH
+            and image.height <= PREPROCESS_MAX_HEIGHT
+        ):
+            return data, "image/jpeg"
+
+        # Let the JPEG decoder downscale by a power of two while decoding;
+        # orientations 5-8 are rotated by 90 degrees so the box is swapped
+        box = (PREPROCESS_MAX_WIDTH, PREPROCESS_MAX_HEIGHT)
+        if orientation in (5, 6, 7, 8):
+            box = (PREPROCESS_MAX_HEIGHT, PREPROCESS_MAX_WIDTH)
+        image.draft("RGB", box)
+
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PREPROCESS_MAX_WIDTH, PREPROCESS_MAX_HEIGHT), Image.Resampling.LANCZOS)
+
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # Flatten transparency onto white, which is what JPEG can encode
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=PREPROCESS_JPEG_QUALITY, optimize=True)
+        return output.getvalue(), "image/jpeg"
+
+async def preprocess_image(data: bytes) -> Tuple[bytes, str]:
+    """Run `normalise_image` on the preprocessing pool"""
+    loop = asyncio.get_running_loop()
+    with STAGE_SECONDS.time(stage="preprocess"):
+        return await loop.run_in_executor(_executor, normalise_image, data)
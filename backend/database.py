@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 load_dotenv()
@@ -11,14 +13,46 @@ DB_HOST = os.getenv("DB_HOST") or "localhost"
 DB_PORT = os.getenv("DB_PORT") or "3306"
 DB_NAME = os.getenv("DB_NAME") or "fashionvirtual"
 
-DATABASE_URL = (
+# DATABASE_URL / ASYNC_DATABASE_URL override the MySQL defaults, e.g.
+# sqlite:///./fashionvirtual.db and sqlite+aiosqlite:///./fashionvirtual.db
+# for local testing.
+DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"mysql+mysqlconnector://{DB_USER}:{DB_PASS}"
     f"@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
 
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (
+    f"mysql+aiomysql://{DB_USER}:{DB_PASS}"
+    f"@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+
+# Connection pool tuning, shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 10)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW") or 20)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT") or 30)
+DB_POOL_PRE_PING = (os.getenv("DB_POOL_PRE_PING") or "true") == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE") or 1800)
+
 echoTF = True if os.getenv("PLATFORM") == "development" else False
 
-engine = create_engine(DATABASE_URL, echo=echoTF)
+def pool_options(url: str) -> dict:
+    """Pool arguments for `url`; in-memory SQLite uses a static pool without sizing"""
+    options = {
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
+engine = create_engine(DATABASE_URL, echo=echoTF, **pool_options(DATABASE_URL))
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -26,6 +60,15 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=echoTF, **pool_options(ASYNC_DATABASE_URL))
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -33,4 +76,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,14 +1,39 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from routers import tryon, auth, gallery
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
+from database import engine, async_engine, Base, SessionLocal
+from schemas.user import TryOnImage
+from utils.http_client import start_http_client, close_http_client
+from utils.uploads import BodySizeLimitMiddleware, MAX_BATCH_REQUEST_BODY_MB
+from utils.storage import normalise_legacy_paths
+from utils.metrics import registry, METRICS_CONTENT_TYPE
+from utils.jobs import claim_job_store_process
 
 Base.metadata.create_all(bind=engine)
+
+# create_all only adds indexes together with new tables, so make sure the
+# gallery indexes also exist on databases created before they were added
+for index in TryOnImage.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+# Legacy per-user try-on files are moved into the blob store by the
+# one-off `python migrate_blobs.py`, not here: this runs in every worker
+with SessionLocal() as db:
+    normalise_legacy_paths(db)
+
 app = FastAPI()
 
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+# Refuse oversized bodies before the multipart parser spools them; added
+# before CORS so the 413 still carries the CORS headers
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    path_max_mb={"/api/try-on/batch": MAX_BATCH_REQUEST_BODY_MB}
+)
+
 # Allow frontend to connect
 app.add_middleware(
     CORSMiddleware,
@@ -22,9 +47,25 @@ app.include_router(tryon.router, prefix="/api")
 app.include_router(auth.router, prefix ="/api")
 app.include_router(gallery.router, prefix="/api")
 
+@app.on_event("startup")
+async def startup_event():
+    # Try-on jobs are held in memory, so only one worker process serves them
+    claim_job_store_process()
+    await start_http_client()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_http_client()
+    await async_engine.dispose()
+
 @app.get("/")
 def root():
     return {
         "status": "Okay",
         "message": "Fashion Virtual Backend is running"
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, job counts, cache and provider failure counters in Prometheus text format"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
@@ -0,0 +1,23 @@
+"""
+One-off move of try-on files saved under uploads/users/<username>/tryon_<id>/
+into the content-addressed blob store.
+
+Run it once, from a single process, after upgrading (the app no longer does
+this at startup, where every worker process would race on the same files):
+
+    python migrate_blobs.py
+
+Rows are migrated one transaction at a time, so it can be re-run safely
+after an interruption.
+"""
+from database import engine, Base, SessionLocal
+from utils.storage import normalise_legacy_paths
+from utils.blob_store import migrate_legacy_uploads
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        # Windows-style keys of old rows must resolve before their files can move
+        normalise_legacy_paths(db)
+        migrated = migrate_legacy_uploads(db)
+    print(f"Migration finished, {migrated} try-on rows moved")
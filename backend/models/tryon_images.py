@@ -1,7 +1,32 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class SaveTryOnImage(BaseModel):
     username: str
     person_bytes: bytes
     cloth_bytes: bytes
-    output_bytes: bytes
\ No newline at end of file
+    output_bytes: bytes
+
+
+class TryOnOptions(BaseModel):
+    """The form fields shared by the try-on endpoints"""
+    instructions: str = ""
+    model_type: str = ""
+    gender: str = ""
+    garment_type: str = ""
+    style: str = ""
+    username: str = ""
+    wait_mode: str = "all"
+    preferred_provider: str = "openai"
+
+
+class TryOnRequest(TryOnOptions):
+    person_bytes: bytes
+    cloth_bytes: bytes
+    person_content_type: str
+    cloth_content_type: str
+    person_digest: str  # sha256 hex of person_bytes
+    cloth_digest: str   # sha256 hex of cloth_bytes
+    # Already preprocessed JPEGs for the worker, shared across a batch
+    person_upload_bytes: Optional[bytes] = None
+    cloth_upload_bytes: Optional[bytes] = None
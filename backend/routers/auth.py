@@ -1,20 +1,33 @@
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
+from typing import Optional
 from models.auth import LoginRequest, SignUpRequest
 from schemas.user import User
-from database import get_db
-from sqlalchemy.orm import Session
-from utils.security import hash_password, verify_password
+from database import get_async_db
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.security import hash_password_async, verify_and_update_password_async, create_access_token, AUTH_TOKEN_TTL_SECONDS
+from utils.user_cache import user_cache, user_snapshot, get_user_by_username, user_from_authorization
 
 load_dotenv()
 
 router = APIRouter()
 
 @router.get("/me")
-async def me(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(
-        username == User.username
-    ).first()
+async def me(
+    username: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # A valid bearer token wins over the legacy `username` query parameter
+    claims = user_from_authorization(authorization)
+    if claims:
+        username = claims["username"]
+
+    if not username:
+        raise HTTPException(status_code=401, detail="You didn't logged In please login")
+
+    user = await get_user_by_username(db, username)
     
     if not user:
         raise HTTPException(
@@ -23,33 +36,47 @@ async def me(username: str, db: Session = Depends(get_db)):
         )
 
     return {
-        "createdAt": user.createdAt,
-        "username": user.username,
-        "name": user.name,
-        "id": user.id,
-        "role": user.role
+        "createdAt": user["createdAt"],
+        "username": user["username"],
+        "name": user["name"],
+        "id": user["id"],
+        "role": user["role"]
     }
 
 @router.post("/login")
-async def login(data: LoginRequest, db: Session = Depends(get_db)):
-    print(data)
-    user = db.query(User).filter(
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(
         User.username == data.username
-    ).first()
+    ))
 
     if not user:
         raise HTTPException(status_code=401, detail="No user found, please SignIn")
 
-    if not verify_password(data.password, user.password):
+    valid, new_hash = await verify_and_update_password_async(data.password, user.password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid Password, please try again with correct password")
+
+    # Transparently upgrade hashes made with an older bcrypt cost
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
+    user_cache.set(user_snapshot(user))
     
-    return {"status_code":200, "detail":"Login Successful", "userId": user.id}
+    return {
+        "status_code":200,
+        "detail":"Login Successful",
+        "userId": user.id,
+        "access_token": create_access_token(user.id, user.username, user.role),
+        "token_type": "bearer",
+        "expires_in": AUTH_TOKEN_TTL_SECONDS
+    }
 
 @router.post("/signUp")
-async def signUp(data: SignUpRequest, db: Session= Depends(get_db)):
-    existing_user = db.query(User).filter(
+async def signUp(data: SignUpRequest, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await db.scalar(select(User).where(
         User.username == data.username
-    ).first()
+    ))
 
     if existing_user:
         raise HTTPException(
@@ -57,9 +84,9 @@ async def signUp(data: SignUpRequest, db: Session= Depends(get_db)):
             detail="User already present, you need use different username or try to login"
         )
     
-    hashed_password = hash_password(data.password)
+    hashed_password = await hash_password_async(data.password)
     
-    user_count = db.query(User).count()
+    user_count = await db.scalar(select(func.count()).select_from(User))
 
     role = 1 if user_count == 0 else 0
 
@@ -72,11 +99,10 @@ async def signUp(data: SignUpRequest, db: Session= Depends(get_db)):
 
     db.add(newUser)
 
-    db.commit()
+    await db.commit()
+
+    user_cache.invalidate(data.username)
 
-    db.refresh(newUser)
-    
-    print(data)
     return {
         "status_code": 200,
         "detail": "Sign In successful, you can login now"
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Query, Header
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from schemas.user import User, TryOnImage
+from utils.user_cache import get_user_by_username, user_from_authorization
+from utils.storage import storage_url, storage_path, to_storage_key, UPLOADS_DIR
+from utils.thumbnails import thumbnail_urls, resize_image_async, RESIZE_WIDTHS
+from utils.blob_store import delete_try_on_image
+from typing import Optional
+import base64
+import binascii
 import os
 from dotenv import load_dotenv
 
@@ -10,62 +18,127 @@ load_dotenv()
 
 router = APIRouter()
 
+GALLERY_DEFAULT_PAGE_SIZE = int(os.getenv("GALLERY_DEFAULT_PAGE_SIZE") or 50)
+GALLERY_MAX_PAGE_SIZE = int(os.getenv("GALLERY_MAX_PAGE_SIZE") or 200)
+
+def encode_cursor(image_id: int) -> str:
+    """Opaque cursor pointing just after the id of the last row"""
+    return base64.urlsafe_b64encode(str(image_id).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid gallery cursor")
+
+async def paginate(db: AsyncSession, stmt, cursor: Optional[str], limit: int):
+    """
+    Keyset pagination over id, newest first.
+
+    Ids grow with insert order, so they sort like createdat without its
+    precision and format differing between databases (and between the
+    bound cursor value and the stored column). Fetches one extra row to know
+    whether there is a next page, so each page is a single range scan of the
+    (userid, id) index or the primary key.
+    """
+    if cursor:
+        stmt = stmt.where(TryOnImage.id < decode_cursor(cursor))
+
+    result = await db.execute(stmt.order_by(TryOnImage.id.desc()).limit(limit + 1))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+
+    return rows, next_cursor
+
 @router.get("/gallery")
-async def gallery(username: str, request: Request, db: Session = Depends(get_db)):
-    print(username)
-    user = db.query(User).filter(
-        User.username==username
-    ).first()
-    print("user: ", user)
+async def gallery(
+    request: Request,
+    username: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(GALLERY_DEFAULT_PAGE_SIZE, ge=1, le=GALLERY_MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Token claims carry id and role, so no user-row lookup is needed;
+    # the legacy `username` parameter goes through the user cache
+    user = user_from_authorization(authorization)
+    if user is None and username:
+        user = await get_user_by_username(db, username)
 
     if not user:
         raise HTTPException(status_code=401, detail="You didn't logged In please login")
     
-    gallery = []
-    
     backend_url = os.getenv("BACKEND_URL") or "http://localhost:8000"
-    
-    if user.role == 1:
-        images = db.query(TryOnImage).all()
 
-        usernames = dict()
+    # One JOINed, column-projected query for both admins and regular users
+    stmt = select(
+        TryOnImage.id,
+        TryOnImage.createdat,
+        TryOnImage.personimagepath,
+        TryOnImage.clothimagepath,
+        TryOnImage.outputimagepath,
+        User.username
+    ).join(User, User.id == TryOnImage.userid)
 
-        for img in images:
-            if img.userid not in usernames:
-                usernames[img.userid] = db.query(User).filter(User.id==img.userid).first()
+    if user["role"] != 1:
+        stmt = stmt.where(TryOnImage.userid == user["id"])
 
-            username = usernames[img.userid].username
+    images, next_cursor = await paginate(db, stmt, cursor, limit)
 
-            gallery.append({
-                "username": username,
-                "person_image_url": f"{backend_url}/uploads{img.personimagepath.replace('uploads','').replace('\\\\', '/').replace('\\', '/')}",
-                "cloth_image_path": f"{backend_url}/uploads{img.clothimagepath.replace('uploads','').replace('\\\\', '/').replace('\\', '/')}",
-                "output_image_path": f"{backend_url}/uploads{img.outputimagepath.replace('uploads','').replace('\\\\', '/').replace('\\', '/')}",
-                "createdat":img.createdat
-            })
+    gallery = [
+        {
+            "id": img.id,
+            "username": img.username,
+            "person_image_url": storage_url(backend_url, img.personimagepath),
+            "cloth_image_path": storage_url(backend_url, img.clothimagepath),
+            "output_image_path": storage_url(backend_url, img.outputimagepath),
+            "thumbnails": {
+                "person": thumbnail_urls(backend_url, img.personimagepath),
+                "cloth": thumbnail_urls(backend_url, img.clothimagepath),
+                "output": thumbnail_urls(backend_url, img.outputimagepath)
+            },
+            "createdat": img.createdat
+        }
+        for img in images
+    ]
+
+    return {
+        "status_code": 200,
+        "detail": "Here your Gallery",
+        "gallery": gallery,
+        "next_cursor": next_cursor
+    }
 
-        return gallery
+@router.delete("/gallery/{image_id}")
+async def delete_gallery_item(
+    image_id: int,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Delete one try-on from the gallery (own items, or any item for admins).
 
-    images = db.query(TryOnImage).filter(
-        User.id==user.id, 
-        TryOnImage.userid==user.id
-    )
+    Requires a bearer token; the legacy `username` parameter is not enough
+    to delete anything. Its images are released from the blob store; files
+    still used by other try-ons are kept.
+    """
+    user = user_from_authorization(authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="You didn't logged In please login")
 
-    for img in images:
+    image = await db.get(TryOnImage, image_id)
+    if not image or (user["role"] != 1 and image.userid != user["id"]):
+        raise HTTPException(status_code=404, detail="Gallery item not found")
 
-        gallery.append({
-            "username": user.username,
-            "person_image_url": f"{backend_url}/uploads{img.personimagepath.replace('uploads','').replace('\\\\', '/').replace('\\', '/')}",
-            "cloth_image_path": f"{backend_url}/uploads{img.clothimagepath.replace('uploads','').replace('\\\\', '/').replace('\\', '/')}",
-            "output_image_path": f"{backend_url}/uploads{img.outputimagepath.replace('uploads','').replace('\\\\', '/').replace('\\', '/')}",
-            "createdat":img.createdat
-        })
+    await delete_try_on_image(db, image)
 
-    print(username)
     return {
         "status_code": 200,
-        "detail": "Here your Gallery",
-        "gallery": gallery
+        "detail": "Gallery item deleted"
     }
 
 @router.get("/download/{path:path}")
@@ -74,4 +147,32 @@ async def download_file(path: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
     filename = os.path.basename(file_path)
-    return FileResponse(file_path, media_type='application/octet-stream', filename=filename)
\ No newline at end of file
+    return FileResponse(file_path, media_type='application/octet-stream', filename=filename)
+
+@router.get("/images/{width}/{key:path}")
+async def resized_image(width: int, key: str):
+    """
+    Serve a WebP variant of an uploaded image at one of the allowed widths.
+
+    Variants are generated on first request (off the event loop) and cached
+    next to the original under thumbs/, where save-time thumbnails also live.
+    """
+    if width not in RESIZE_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"width must be one of {list(RESIZE_WIDTHS)}")
+
+    key = to_storage_key(key)
+    source_path = storage_path(key).resolve()
+    if UPLOADS_DIR.resolve() not in source_path.parents or not source_path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        resized_key = await resize_image_async(key, width)
+    except Exception as e:
+        print(f"[ERROR] Resizing {key} to {width}px failed: {str(e)}")
+        raise HTTPException(status_code=415, detail="File is not a supported image")
+
+    return FileResponse(
+        storage_path(resized_key),
+        media_type="image/webp",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
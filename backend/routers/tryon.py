@@ -1,16 +1,29 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 import os
+import asyncio
 import base64
+import json
+import logging
+import time
 import traceback
-import requests
-from openai import OpenAI
-from utils.tryon_images import save_try_on_images
-from models.tryon_images import SaveTryOnImage
+import httpx
+from typing import List
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, APIStatusError
+from utils.http_client import get_http_client
+from utils.result_cache import tryon_cache
+from utils.uploads import ingest_upload, TRYON_BATCH_MAX_ITEMS
+from utils.metrics import STAGE_SECONDS, PROVIDER_FAILURES
+from utils.image_preprocess import preprocess_image
+from utils.tryon_images import persist_try_on_images
+from utils.jobs import job_store, require_job_store, Job, JOB_RUNNING, JOB_COMPLETED, JOB_FINISHED_STATES
+from models.tryon_images import SaveTryOnImage, TryOnOptions, TryOnRequest
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -21,100 +34,404 @@ EXTERNAL_TRYON_URL = os.getenv("HUG_VIRTUAL_TRY_ON_BACKEND_URL")
 if not EXTERNAL_TRYON_URL:
     raise ValueError("Missing HUG_VIRTUAL_TRY_ON_BACKEND_URL in .env")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Per-provider deadlines (seconds). Both providers run concurrently, so the
+# slowest one bounds the request instead of their sum.
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS") or 120)
+EXTERNAL_TRYON_TIMEOUT_SECONDS = float(os.getenv("EXTERNAL_TRYON_TIMEOUT_SECONDS") or 120)
+
+# "all" waits for every provider, "preferred" returns as soon as the preferred
+# provider has a successful result and cancels the rest.
+TRYON_WAIT_MODES = {"all", "preferred"}
+TRYON_PROVIDERS = ("openai", "external")
+
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT_SECONDS)
+
+# Ask the worker for the raw image first; older workers ignore this and answer
+# with the JSON/base64 body, which is still understood below.
+EXTERNAL_TRYON_ACCEPT = "image/png, image/*;q=0.9, application/json;q=0.5"
+
+class ProviderError(Exception):
+    """A provider call that produced no image; `reason` labels the failure metric"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+def failure_reason(error: Exception) -> str:
+    """Metric label for a failed provider call: timeout, connect, http_status, ..."""
+    if isinstance(error, ProviderError):
+        return error.reason
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, APITimeoutError)):
+        return "timeout"
+    if isinstance(error, (httpx.ConnectError, APIConnectionError)):
+        return "connect"
+    if isinstance(error, APIStatusError):
+        return "http_status"
+    return "error"
+
+def parse_external_tryon_response(response):
+    """
+    Return (image_bytes, media_type, image_base64) from a worker response.
+
+    Binary responses carry the image as the body. JSON responses are decoded
+    once and the original base64 string is kept so it is not re-encoded.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+
+    if content_type.startswith("image/"):
+        if response.headers.get("x-tryon-status", "ok") != "ok" or not response.content:
+            return None, None, None
+        return response.content, content_type, None
+
+    result = response.json()
+    if result.get('status') == 'ok' and result.get('image_base64'):
+        image_base64 = result['image_base64']
+        return base64.b64decode(image_base64, validate=True), "image/png", image_base64
+
+    return None, None, None
+
+def to_data_url(image_bytes, media_type):
+    with STAGE_SECONDS.time(stage="base64_encode"):
+        return f"data:{media_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+async def run_external_job(files, deadline, on_progress):
+    """
+    Run a try-on through the worker's job API, passing each progress update
+    (its queue position) to `on_progress`; returns the response for the
+    finished job, in the same forms as /virtual-try-on, or None when the
+    worker would not take the job.
+    """
+    http = get_http_client()
+    submitted = await http.post(
+        f"{EXTERNAL_TRYON_URL}/virtual-try-on/jobs",
+        files=files,
+        headers={"X-Request-Deadline": f"{deadline:.3f}"}
+    )
+    if submitted.status_code == 503:
+        # Busy, or a worker process that does not serve jobs: the blocking
+        # call decides
+        return None
+    if submitted.status_code != 202:
+        raise ProviderError("http_status", f"Try-on worker answered HTTP {submitted.status_code}")
+    job_url = f"{EXTERNAL_TRYON_URL}/virtual-try-on/jobs/{submitted.json()['job_id']}"
+
+    final = None
+    try:
+        async with http.stream("GET", f"{job_url}/events") as events:
+            if events.status_code != 200:
+                raise ProviderError("http_status", f"Try-on worker answered HTTP {events.status_code}")
+            event = None
+            async for line in events.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    snapshot = json.loads(line[len("data:"):])
+                    if event == "status":
+                        on_progress(snapshot["progress"])
+                    else:
+                        final = snapshot
+                        break
+    finally:
+        if final is None:
+            # Given up (cancelled or the stream broke): free the worker's token
+            try:
+                await http.delete(job_url)
+            except httpx.HTTPError:
+                pass
+
+    if final is None:
+        raise ProviderError("error", "Try-on worker closed the job event stream")
+    if final["status"] != JOB_COMPLETED:
+        status_code = (final.get("error") or {}).get("status_code")
+        raise ProviderError("http_status", f"Try-on worker job {final['status']} (HTTP {status_code})")
+    return await http.get(job_url, headers={"Accept": EXTERNAL_TRYON_ACCEPT})
+
+async def call_external_tryon_backend(person_image_bytes, cloth_image_bytes, person_content_type, cloth_content_type, username, cache_key=None, background_tasks=None, preprocessed=None, on_progress=None):
+    """
+    Call external Virtual Try-On backend service.
 
-async def call_external_tryon_backend(person_image_bytes, cloth_image_bytes, person_content_type, cloth_content_type, username):
-    """Call external Virtual Try-On backend service"""
+    `preprocessed` is an optional (person, cloth) pair of JPEGs already run
+    through preprocess_image, as shared by the images of a batch. With
+    `on_progress`, the call goes through the worker's job API and its queue
+    position is passed on as it moves. Failures
+    raise ProviderError with the reason (timeout, connect, http_status,
+    invalid_response, no_result or error).
+    """
+    # Absolute deadline of this provider call, forwarded so the worker can
+    # drop the job once nobody is waiting for it
+    deadline = time.time() + EXTERNAL_TRYON_TIMEOUT_SECONDS
     try:
-        # Create file-like objects from bytes
-        import io
-        
-        person_file = io.BytesIO(person_image_bytes)
-        cloth_file = io.BytesIO(cloth_image_bytes)
-        
+        cached = await tryon_cache.get(cache_key) if cache_key else None
+        if cached:
+            output_bytes, media_type = cached
+            await persist_try_on_images(SaveTryOnImage(
+                username=username,
+                person_bytes=person_image_bytes,
+                cloth_bytes=cloth_image_bytes,
+                output_bytes=output_bytes
+            ), background_tasks)
+            return to_data_url(output_bytes, media_type)
+
+        # Orient, downscale to the model resolution and re-encode before
+        # uploading; the originals are still what gets saved to the gallery
+        if preprocessed:
+            upload_person_bytes, upload_cloth_bytes = preprocessed
+            person_content_type = cloth_content_type = "image/jpeg"
+        else:
+            (upload_person_bytes, person_content_type), (upload_cloth_bytes, cloth_content_type) = await asyncio.gather(
+                preprocess_image(person_image_bytes),
+                preprocess_image(cloth_image_bytes)
+            )
+
         # Create files dictionary with proper format
         files = {
-            'vton_image': ('person_image.jpg', person_file, person_content_type),
-            'garment_image': ('garment_image.jpg', cloth_file, cloth_content_type)
+            'vton_image': ('person_image.jpg', upload_person_bytes, person_content_type),
+            'garment_image': ('garment_image.jpg', upload_cloth_bytes, cloth_content_type)
         }
         
-        response = requests.post(
-            f"{EXTERNAL_TRYON_URL}/virtual-try-on",
-            files=files,
-            timeout=120
-        )
+        with STAGE_SECONDS.time(stage="external_request"):
+            response = None
+            if on_progress:
+                response = await run_external_job(files, deadline, on_progress)
+            if response is None:
+                response = await get_http_client().post(
+                    f"{EXTERNAL_TRYON_URL}/virtual-try-on",
+                    files=files,
+                    headers={
+                        "Accept": EXTERNAL_TRYON_ACCEPT,
+                        "X-Request-Deadline": f"{deadline:.3f}"
+                    }
+                )
         
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                
-                if result.get('status') == 'ok' and result.get('image_base64'):
-                    # Validate base64 string
-                    image_base64 = result['image_base64']
-                    try:
-
-                        data = SaveTryOnImage(
-                            username=username,
-                            person_bytes=person_image_bytes,
-                            cloth_bytes=cloth_image_bytes,
-                            output_bytes=base64.b64decode(image_base64)
-                        )
-
-                        result = await save_try_on_images(data)
-
-                        base64.b64decode(image_base64)
-                        return f"data:image/png;base64,{image_base64}"
-                    except Exception as b64_error:
-                        return None
-                else:
-                    return None
-            except ValueError as json_error:
-                return None
-        else:
-            return None
-    except requests.exceptions.Timeout:
-        return None
-    except requests.exceptions.ConnectionError as conn_error:
-        return None
+        if response.status_code != 200:
+            raise ProviderError("http_status", f"Try-on worker answered HTTP {response.status_code}")
+
+        try:
+            output_bytes, media_type, image_base64 = parse_external_tryon_response(response)
+        except ValueError:
+            # Invalid JSON body or invalid base64 payload
+            raise ProviderError("invalid_response", "Try-on worker sent an unreadable response")
+
+        if not output_bytes:
+            raise ProviderError("no_result", "Try-on worker returned no image")
+
+        if cache_key:
+            await tryon_cache.set(cache_key, output_bytes, media_type)
+
+        data = SaveTryOnImage(
+            username=username,
+            person_bytes=person_image_bytes,
+            cloth_bytes=cloth_image_bytes,
+            output_bytes=output_bytes
+        )
+
+        await persist_try_on_images(data, background_tasks)
+
+        if image_base64 is None:
+            return to_data_url(output_bytes, media_type)
+        return f"data:{media_type};base64,{image_base64}"
+    except ProviderError:
+        raise
+    except httpx.TimeoutException:
+        raise ProviderError("timeout", "Try-on worker timed out")
+    except httpx.ConnectError:
+        raise ProviderError("connect", "Could not connect to the try-on worker")
     except Exception as e:
-        return None
+        raise ProviderError("error", f"External try-on failed: {str(e)}") from e
 
-@router.post("/try-on")
-async def try_on(
-    person_image: UploadFile = File(...),
-    cloth_image: UploadFile = File(...),
+async def generate_openai_image(prompt, cache_key=None):
+    """Generate a try-on image with OpenAI and return it as a data URL"""
+    cached = await tryon_cache.get(cache_key) if cache_key else None
+    if cached:
+        return to_data_url(*cached)
+
+    with STAGE_SECONDS.time(stage="openai_generation"):
+        result = await client.images.generate(
+            model="gpt-image-1",
+            prompt=prompt,
+            size="1024x1024"
+        )
+    image_base64 = result.data[0].b64_json
+
+    if cache_key and image_base64:
+        await tryon_cache.set(cache_key, base64.b64decode(image_base64), "image/png")
+
+    return f"data:image/png;base64,{image_base64}"
+
+async def run_providers(providers, preferred="openai", wait_mode="all", on_result=None):
+    """
+    Run provider coroutines concurrently, each under its own deadline.
+
+    `providers` maps a provider name to a (coroutine, timeout) pair. Returns a
+    dict of name -> {"success", "image", "error"}. In "preferred" mode the call
+    returns as soon as the preferred provider succeeds and the others are
+    cancelled; if it fails, the remaining providers are still awaited.
+    `on_result(name, result)` is called as each provider finishes.
+    """
+    tasks = {
+        asyncio.create_task(asyncio.wait_for(coro, timeout)): name
+        for name, (coro, timeout) in providers.items()
+    }
+    results = {}
+    pending = set(tasks)
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                name = tasks[task]
+                try:
+                    image = task.result()
+                    results[name] = {
+                        "success": image is not None,
+                        "image": image,
+                        "error": None if image is not None else f"{name} provider returned no image"
+                    }
+                except asyncio.TimeoutError:
+                    logger.warning(f"{name} provider timed out")
+                    results[name] = {"success": False, "image": None, "error": f"{name} provider timed out"}
+                    PROVIDER_FAILURES.inc(provider=name, reason="timeout")
+                except Exception as e:
+                    logger.warning(f"{name} provider failed: {str(e)}")
+                    results[name] = {"success": False, "image": None, "error": str(e)}
+                    PROVIDER_FAILURES.inc(provider=name, reason=failure_reason(e))
+                else:
+                    if image is None:
+                        PROVIDER_FAILURES.inc(provider=name, reason="no_result")
+
+                if on_result:
+                    on_result(name, results[name])
+
+            if wait_mode == "preferred" and results.get(preferred, {}).get("success"):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+            # success=None keeps the "not attempted" meaning used in the response
+            results[tasks[task]] = {
+                "success": None,
+                "image": None,
+                "error": "Cancelled after the preferred provider finished"
+            }
+        # Let the cancelled providers unwind before returning
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return results
+
+@router.get("/try-on/cache")
+async def try_on_cache_stats():
+    """Hit/miss counters and sizes of the try-on result cache"""
+    return tryon_cache.stats()
+
+# ---- Validate input parameters ----
+ALLOWED_MIME_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+}
+
+def try_on_options(
     instructions: str = Form(""),
     model_type: str = Form(""),
     gender: str = Form(""),
     garment_type: str = Form(""),
     style: str = Form(""),
-    username: str = Form("")
-):
-    try:
-        # ---- Validate input parameters ----
-        MAX_IMAGE_SIZE_MB = 20
-        ALLOWED_MIME_TYPES = {
-            "image/jpeg",
-            "image/png",
-            "image/webp",
-        }
+    username: str = Form(""),
+    wait_mode: str = Form("all"),
+    preferred_provider: str = Form("openai")
+) -> TryOnOptions:
+    """Dependency reading and validating the form fields of the try-on endpoints"""
+    if wait_mode not in TRYON_WAIT_MODES:
+        raise HTTPException(status_code=400, detail=f"wait_mode must be one of {sorted(TRYON_WAIT_MODES)}")
+    if preferred_provider not in TRYON_PROVIDERS:
+        raise HTTPException(status_code=400, detail=f"preferred_provider must be one of {list(TRYON_PROVIDERS)}")
+    return TryOnOptions(
+        instructions=instructions,
+        model_type=model_type,
+        gender=gender,
+        garment_type=garment_type,
+        style=style,
+        username=username,
+        wait_mode=wait_mode,
+        preferred_provider=preferred_provider
+    )
+
+def build_try_on_request(person, cloth, options: TryOnOptions, upload_bytes: dict = None) -> TryOnRequest:
+    """
+    TryOnRequest for an ingested (person, cloth) pair; `upload_bytes` maps
+    digests to images already preprocessed for the worker
+    """
+    upload_bytes = upload_bytes or {}
+    return TryOnRequest(
+        person_bytes=person.data,
+        cloth_bytes=cloth.data,
+        person_content_type=person.media_type,
+        cloth_content_type=cloth.media_type,
+        person_digest=person.sha256,
+        cloth_digest=cloth.sha256,
+        person_upload_bytes=upload_bytes.get(person.sha256),
+        cloth_upload_bytes=upload_bytes.get(cloth.sha256),
+        **options.model_dump()
+    )
+
+async def read_try_on_images(person_image: UploadFile, cloth_image: UploadFile):
+    """
+    Validate and stream in both uploads; returns (person, cloth) IngestedUploads.
+
+    Each upload is read in chunks and rejected as soon as it passes
+    MAX_IMAGE_SIZE_MB or its leading bytes are not an accepted image.
+    """
+    # Cheap check on the declared type before reading anything
+    if person_image.content_type not in ALLOWED_MIME_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported person image type")
+    if cloth_image.content_type not in ALLOWED_MIME_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported cloth image type")
 
-        # ---- Validate person image ----
-        if person_image.content_type not in ALLOWED_MIME_TYPES:
-            raise HTTPException(status_code=400, detail="Unsupported person image type")
+    person = await ingest_upload(person_image, "person image")
+    cloth = await ingest_upload(cloth_image, "cloth image")
+    return person, cloth
+
+async def read_batch_images(person_images: List[UploadFile], cloth_images: List[UploadFile]):
+    """
+    Validate and stream in the uploads of a batch; returns (persons, cloths).
+
+    One side must hold a single image and the other at most
+    TRYON_BATCH_MAX_ITEMS, so the shared image is read and checked once.
+    """
+    if len(person_images) != 1 and len(cloth_images) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="A batch takes one person image with several cloth images, or several person images with one cloth image."
+        )
+    if max(len(person_images), len(cloth_images)) > TRYON_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch takes at most {TRYON_BATCH_MAX_ITEMS} images per side")
 
-        person_bytes = await person_image.read()
-        if len(person_bytes) / (1024 * 1024) > MAX_IMAGE_SIZE_MB:
-            raise HTTPException(status_code=400, detail="Person image exceeds 10MB")
+    # Cheap check on the declared type before reading anything
+    if any(image.content_type not in ALLOWED_MIME_TYPES for image in person_images):
+        raise HTTPException(status_code=400, detail="Unsupported person image type")
+    if any(image.content_type not in ALLOWED_MIME_TYPES for image in cloth_images):
+        raise HTTPException(status_code=400, detail="Unsupported cloth image type")
 
-        # ---- Validate cloth image ----
-        if cloth_image.content_type not in ALLOWED_MIME_TYPES:
-            raise HTTPException(status_code=400, detail="Unsupported cloth image type")
+    persons = [await ingest_upload(image, f"person image {i + 1}") for i, image in enumerate(person_images)]
+    cloths = [await ingest_upload(image, f"cloth image {i + 1}") for i, image in enumerate(cloth_images)]
+    return persons, cloths
 
-        cloth_bytes = await cloth_image.read()
-        if len(cloth_bytes) / (1024 * 1024) > MAX_IMAGE_SIZE_MB:
-            raise HTTPException(status_code=400, detail="Cloth image exceeds 10MB")
+async def run_try_on(req: TryOnRequest, background_tasks: BackgroundTasks = None, job: Job = None) -> dict:
+    """
+    Run the providers for one try-on and build the response body.
 
+    Shared by the blocking /try-on endpoint and the job API. With `job`,
+    each provider's outcome is published as job progress as it finishes,
+    along with the external worker's queue position.
+    """
+    model_type = req.model_type
+    garment_type = req.garment_type
+    gender = req.gender
+    style = req.style
+    instructions = req.instructions
+    preferred_provider = req.preferred_provider
+    try:
         # ---- OpenAI Image Generation ----
         # Since OpenAI images.generate() doesn't support reference images,
         # we create a descriptive prompt for virtual try-on
@@ -140,42 +457,68 @@ Context:
 Generate a professional fashion photography style image showing the virtual try-on result.
 """
 
-        # ---- OpenAI Image Generation ----
-        try:
-            result = client.images.generate(
-                model="gpt-image-1",
-                prompt=prompt,
-                size="1024x1024"
+        # ---- Cache keys (hash of the inputs and the parameters each provider uses) ----
+        # The digests were computed while the uploads were read
+        person_digest, cloth_digest = req.person_digest, req.cloth_digest
+        openai_cache_key = tryon_cache.make_key("openai", person_digest, cloth_digest, {
+            "model_type": model_type,
+            "gender": gender,
+            "garment_type": garment_type,
+            "style": style,
+            "instructions": instructions
+        })
+        external_cache_key = tryon_cache.make_key("external", person_digest, cloth_digest)
+        preprocessed = None
+        if req.person_upload_bytes and req.cloth_upload_bytes:
+            preprocessed = (req.person_upload_bytes, req.cloth_upload_bytes)
+
+        # A job follows the worker's queue position as well
+        external_progress = None
+        if job is not None:
+            external_progress = lambda progress: job.update(external_queue=progress)
+
+        # ---- Run OpenAI and External Backend concurrently ----
+        providers = {
+            "openai": (generate_openai_image(prompt, openai_cache_key), OPENAI_TIMEOUT_SECONDS)
+        }
+        if model_type == "top":
+            providers["external"] = (
+                call_external_tryon_backend(
+                    req.person_bytes, 
+                    req.cloth_bytes, 
+                    req.person_content_type, 
+                    req.cloth_content_type,
+                    req.username,
+                    external_cache_key,
+                    background_tasks,
+                    preprocessed,
+                    on_progress=external_progress
+                ),
+                EXTERNAL_TRYON_TIMEOUT_SECONDS
             )
-            openai_image_base64 = result.data[0].b64_json
-            openai_image_url = f"data:image/png;base64,{openai_image_base64}"
-            openai_success = True
-        except Exception as e:
-            print(f"OpenAI generation failed: {str(e)}")
-            openai_image_url = None
-            openai_success = False
 
-        # ---- Call External Backend ----
+        on_result = None
+        if job is not None:
+            job.update(JOB_RUNNING, providers={name: "running" for name in providers})
+            on_result = lambda name, result: job.update(providers={
+                **job.progress["providers"],
+                name: "succeeded" if result["success"] else "failed"
+            })
+
+        results = await run_providers(providers, preferred=preferred_provider, wait_mode=req.wait_mode, on_result=on_result)
+
+        openai_result = results.get("openai", {})
+        openai_success = openai_result.get("success", False)
+        openai_image_url = openai_result.get("image")
+
         external_image_url = None
         external_error_message = None
         external_success = None
-        
-        if model_type == "top":
-            try:
-                external_image_url = await call_external_tryon_backend(
-                    person_bytes, 
-                    cloth_bytes, 
-                    person_image.content_type, 
-                    cloth_image.content_type,
-                    username
-                )
-                external_success = external_image_url is not None
-                if not external_success:
-                    external_error_message = "External backend returned no image"
-            except Exception as e:
-                print(f"External backend call failed: {str(e)}")
-                external_success = False
-                external_error_message = str(e)
+
+        if "external" in results:
+            external_success = results["external"]["success"]
+            external_image_url = results["external"]["image"]
+            external_error_message = results["external"]["error"]
 
         # Check if at least one service succeeded
         if not openai_success and not external_success:
@@ -209,7 +552,7 @@ Generate a professional fashion photography style image showing the virtual try-
         
         # Add which service provided the result
         if openai_success and external_success:
-            response_content["primary_result"] = "openai"  # Prefer OpenAI if both work
+            response_content["primary_result"] = preferred_provider
         elif openai_success:
             response_content["primary_result"] = "openai"
         elif external_success:
@@ -217,9 +560,9 @@ Generate a professional fashion photography style image showing the virtual try-
         else:
             response_content["primary_result"] = "none"
 
-        return JSONResponse(content=response_content)
+        return response_content
 
-    except HTTPException:
+    except (HTTPException, asyncio.CancelledError):
         # Re-raise HTTP exceptions as-is
         raise
     except Exception as e:
@@ -264,4 +607,133 @@ Generate a professional fashion photography style image showing the virtual try-
         raise HTTPException(status_code=500, detail=user_message)
     finally:
         # Clean up any resources if needed
-        print(f"Try-on request completed for {model_type} {garment_type}")
\ No newline at end of file
+        print(f"Try-on request completed for {model_type} {garment_type}")
+
+@router.post("/try-on")
+async def try_on(
+    background_tasks: BackgroundTasks,
+    person_image: UploadFile = File(...),
+    cloth_image: UploadFile = File(...),
+    options: TryOnOptions = Depends(try_on_options)
+):
+    person, cloth = await read_try_on_images(person_image, cloth_image)
+
+    response_content = await run_try_on(build_try_on_request(person, cloth, options), background_tasks)
+    return JSONResponse(content=response_content)
+
+@router.post("/try-on/jobs", status_code=202, dependencies=[Depends(require_job_store)])
+async def submit_try_on_job(
+    person_image: UploadFile = File(...),
+    cloth_image: UploadFile = File(...),
+    options: TryOnOptions = Depends(try_on_options)
+):
+    """
+    Same inputs as /try-on, but returns a job id straight away.
+
+    Poll `GET /try-on/jobs/{job_id}` or follow `GET /try-on/jobs/{job_id}/events`
+    (server-sent events) for progress; the finished job carries the /try-on body.
+    """
+    person, cloth = await read_try_on_images(person_image, cloth_image)
+
+    req = build_try_on_request(person, cloth, options)
+    # No response to attach background tasks to, so the job saves inline
+    job = job_store.submit(lambda job: run_try_on(req, None, job))
+    return {
+        **job.snapshot(),
+        "status_url": f"/api/try-on/jobs/{job.id}",
+        "events_url": f"/api/try-on/jobs/{job.id}/events"
+    }
+
+@router.post("/try-on/batch")
+async def try_on_batch(
+    person_images: List[UploadFile] = File(...),
+    cloth_images: List[UploadFile] = File(...),
+    options: TryOnOptions = Depends(try_on_options)
+):
+    """
+    One person with several cloth images, or several persons with one cloth image.
+
+    Every image is read, validated and preprocessed for the worker once, and
+    the pairs run concurrently so the worker spreads them over its tokens.
+    Results stream back as NDJSON in completion order, one line per pair:
+    `index`, `person_index`, `cloth_index` and `status_code`, then `result`
+    (the /try-on body) or `detail`.
+    """
+    persons, cloths = await read_batch_images(person_images, cloth_images)
+    pairs = [(p, c) for p in range(len(persons)) for c in range(len(cloths))]
+
+    # Only the external provider uploads the images; preprocess each once
+    upload_bytes = {}
+    if options.model_type == "top":
+        unique = {image.sha256: image for image in persons + cloths}
+        try:
+            outputs = await asyncio.gather(*(preprocess_image(image.data) for image in unique.values()))
+            upload_bytes = {digest: data for digest, (data, _) in zip(unique, outputs)}
+        except Exception as e:
+            # Each pair falls back to preprocessing its own images
+            logger.error(f"Preprocessing batch images failed: {str(e)}")
+
+    async def batch_results():
+        tasks = {}
+        try:
+            for index, (p, c) in enumerate(pairs):
+                # No response to attach background tasks to, so each pair saves inline
+                task = asyncio.create_task(run_try_on(build_try_on_request(persons[p], cloths[c], options, upload_bytes)))
+                tasks[task] = {"index": index, "person_index": p, "cloth_index": c}
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield batch_line(tasks[task], task)
+        finally:
+            # Reached when the client disconnects as well
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StreamingResponse(
+        batch_results(),
+        media_type="application/x-ndjson",
+        headers={"X-TryOn-Batch-Size": str(len(pairs)), "X-Accel-Buffering": "no"}
+    )
+
+def batch_line(item: dict, task: asyncio.Task) -> str:
+    """One NDJSON line for a finished pair of a batch"""
+    try:
+        result = task.result()
+    except HTTPException as e:
+        return json.dumps({**item, "status_code": e.status_code, "detail": e.detail}) + "\n"
+    return json.dumps({**item, "status_code": 200, "result": result}) + "\n"
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@router.get("/try-on/jobs/{job_id}", dependencies=[Depends(require_job_store)])
+async def get_try_on_job(job_id: str):
+    """Status of a try-on job, with the /try-on response body once completed"""
+    job = get_job_or_404(job_id)
+    snapshot = job.snapshot()
+    if job.status == JOB_COMPLETED:
+        snapshot["result"] = job.result
+    return snapshot
+
+@router.get("/try-on/jobs/{job_id}/events", dependencies=[Depends(require_job_store)])
+async def try_on_job_events(job_id: str):
+    """Server-sent `status` events as providers finish, then a final completed/failed/cancelled event"""
+    job = get_job_or_404(job_id)
+    return StreamingResponse(
+        job_store.events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/try-on/jobs/{job_id}", dependencies=[Depends(require_job_store)])
+async def cancel_try_on_job(job_id: str):
+    job = job_store.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {"job_id": job.id, "status": "cancelling" if job.status not in JOB_FINISHED_STATES else job.status}
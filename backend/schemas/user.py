@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Index
 from database import Base
 
 class User(Base):
@@ -20,3 +20,24 @@ class TryOnImage(Base):
     clothimagepath = Column(String(255), nullable=False)
     outputimagepath = Column(String(255), nullable=False)
     createdat = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Keyset pagination of a user's gallery: WHERE userid = ? ORDER BY id;
+        # the admin gallery walks the primary key
+        Index("ix_tryonimage_userid_id", "userid", "id"),
+    )
+
+class Blob(Base):
+    """
+    One stored file in the content-addressed blob store.
+
+    Try-on rows point at `storagekey` through their path columns; `refcount`
+    counts those references and the file is deleted when it drops to zero.
+    """
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    storagekey = Column(String(255), nullable=False)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    createdat = Column(DateTime, server_default=func.now())
@@ -0,0 +1,7 @@
+import os
+
+# utils.security refuses to import without a real signing key, and
+# routers.tryon without its provider settings
+os.environ.setdefault("AUTH_SECRET_KEY", "test-secret-key")
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("HUG_VIRTUAL_TRY_ON_BACKEND_URL", "http://tryon-worker.invalid")
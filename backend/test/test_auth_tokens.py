@@ -0,0 +1,67 @@
+from fastapi import HTTPException
+from utils import security, user_cache as user_cache_module
+from utils.security import create_access_token, decode_access_token
+from utils.user_cache import UserCache, user_from_authorization
+import pytest
+
+def snapshot(username):
+    return {"id": 1, "name": username, "username": username, "role": 0, "createdAt": None}
+
+def test_token_round_trip():
+    token = create_access_token(7, "alice", 1)
+    claims = decode_access_token(token)
+    assert (claims["sub"], claims["username"], claims["role"]) == (7, "alice", 1)
+    assert user_from_authorization(f"Bearer {token}") == {"id": 7, "username": "alice", "role": 1}
+
+def test_tampered_token_is_rejected():
+    token = create_access_token(7, "alice", 0)
+    payload, signature = token.split(".")
+    assert decode_access_token(f"{payload}.{signature[:-1]}{'A' if signature[-1] != 'A' else 'B'}") is None
+
+    # Claims re-signed as an admin without the key do not verify either
+    admin = create_access_token(7, "alice", 1).split(".")[0]
+    assert decode_access_token(f"{admin}.{signature}") is None
+
+def test_expired_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(security, "AUTH_TOKEN_TTL_SECONDS", -1)
+    token = create_access_token(7, "alice", 0)
+    assert decode_access_token(token) is None
+    with pytest.raises(HTTPException) as error:
+        user_from_authorization(f"Bearer {token}")
+    assert error.value.status_code == 401
+
+@pytest.mark.parametrize("header", ["Bearer", "Bearer not-a-token", "Basic YWxpY2U6cHc=", "Bearer a.b.c"])
+def test_malformed_authorization_header_is_401(header):
+    with pytest.raises(HTTPException) as error:
+        user_from_authorization(header)
+    assert error.value.status_code == 401
+
+def test_missing_authorization_header_is_anonymous():
+    assert user_from_authorization(None) is None
+
+def test_user_cache_entry_expires_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_cache_module.time, "time", lambda: now[0])
+    cache = UserCache(ttl_seconds=60, max_entries=10)
+    cache.set(snapshot("alice"))
+
+    now[0] += 59
+    assert cache.get("alice") == snapshot("alice")
+    now[0] += 1
+    assert cache.get("alice") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_user_cache_invalidate_and_lru_eviction():
+    cache = UserCache(ttl_seconds=60, max_entries=2)
+    cache.set(snapshot("alice"))
+    cache.set(snapshot("bob"))
+    cache.invalidate("alice")
+    assert cache.get("alice") is None
+
+    cache.set(snapshot("carol"))
+    cache.get("bob")
+    cache.set(snapshot("dave"))
+    # carol was the least recently used of the two held entries
+    assert cache.get("carol") is None
+    assert cache.get("bob") is not None
+    assert cache.get("dave") is not None
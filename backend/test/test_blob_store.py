@@ -0,0 +1,117 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import Base
+from schemas.user import User, TryOnImage, Blob
+from utils.blob_store import acquire_blobs, delete_try_on_image
+from utils.storage import storage_path
+from utils.thumbnails import thumbnail_key, RESIZE_WIDTHS
+import asyncio
+import pytest
+
+PERSON = b"\xff\xd8\xff" + b"person"
+OTHER_PERSON = b"\xff\xd8\xff" + b"other person"
+GARMENT = b"\xff\xd8\xff" + b"garment"
+OUTPUT = b"\x89PNG\r\n\x1a\n" + b"output"
+
+def run_with_db(tmp_path, monkeypatch, body):
+    """Run `body(db, user_id)` against a fresh SQLite database with uploads/ under tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'blobs.db'}")
+    session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session() as db:
+            user = User(username="alice", role=0)
+            db.add(user)
+            await db.commit()
+            result = await body(db, user.id)
+        await engine.dispose()
+        return result
+
+    return asyncio.run(run())
+
+async def add_try_on(db, user_id, person):
+    keys = await acquire_blobs(db, [person, GARMENT, OUTPUT])
+    image = TryOnImage(userid=user_id, personimagepath=keys[0], clothimagepath=keys[1], outputimagepath=keys[2])
+    db.add(image)
+    await db.commit()
+    return image
+
+async def refcounts(db):
+    return {row.storagekey: row.refcount for row in (await db.execute(select(Blob))).scalars()}
+
+def write_thumbnails(key):
+    for width in RESIZE_WIDTHS:
+        path = storage_path(thumbnail_key(key, width))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"thumb")
+
+def test_shared_garment_is_stored_once(tmp_path, monkeypatch):
+    async def body(db, user_id):
+        first = await add_try_on(db, user_id, PERSON)
+        second = await add_try_on(db, user_id, OTHER_PERSON)
+        return first, second, await refcounts(db)
+
+    first, second, counts = run_with_db(tmp_path, monkeypatch, body)
+    assert first.clothimagepath == second.clothimagepath
+    assert first.personimagepath != second.personimagepath
+    assert counts[first.clothimagepath] == 2
+    assert counts[first.personimagepath] == 1
+    assert storage_path(first.clothimagepath).read_bytes() == GARMENT
+    assert storage_path(first.clothimagepath).name.endswith(".jpg")
+
+def test_deleting_one_reference_keeps_the_file(tmp_path, monkeypatch):
+    async def body(db, user_id):
+        first = await add_try_on(db, user_id, PERSON)
+        await add_try_on(db, user_id, OTHER_PERSON)
+        await delete_try_on_image(db, first)
+        return first, await refcounts(db)
+
+    first, counts = run_with_db(tmp_path, monkeypatch, body)
+    assert counts[first.clothimagepath] == 1
+    assert counts[first.outputimagepath] == 1
+    assert storage_path(first.clothimagepath).read_bytes() == GARMENT
+    # Only the person image was this try-on's alone
+    assert first.personimagepath not in counts
+    assert not storage_path(first.personimagepath).exists()
+
+def test_deleting_the_last_reference_removes_file_and_thumbnails(tmp_path, monkeypatch):
+    async def body(db, user_id):
+        image = await add_try_on(db, user_id, PERSON)
+        write_thumbnails(image.clothimagepath)
+        await delete_try_on_image(db, image)
+        return image, await refcounts(db)
+
+    image, counts = run_with_db(tmp_path, monkeypatch, body)
+    assert counts == {}
+    for key in (image.personimagepath, image.clothimagepath, image.outputimagepath):
+        assert not storage_path(key).exists()
+    for width in RESIZE_WIDTHS:
+        assert not storage_path(thumbnail_key(image.clothimagepath, width)).exists()
+    assert list((tmp_path / "uploads" / "blobs" / ".trash").iterdir()) == []
+
+def test_failed_commit_restores_trashed_files(tmp_path, monkeypatch):
+    async def body(db, user_id):
+        image = await add_try_on(db, user_id, PERSON)
+        keys = (image.personimagepath, image.clothimagepath, image.outputimagepath)
+        write_thumbnails(image.personimagepath)
+
+        async def failing_commit():
+            raise RuntimeError("database went away")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(db, "commit", failing_commit)
+            with pytest.raises(RuntimeError):
+                await delete_try_on_image(db, image)
+        return keys, await refcounts(db)
+
+    (person, garment, output), counts = run_with_db(tmp_path, monkeypatch, body)
+    # The references were rolled back, and the files moved back in place
+    assert counts == {person: 1, garment: 1, output: 1}
+    assert storage_path(person).read_bytes() == PERSON
+    assert storage_path(garment).read_bytes() == GARMENT
+    assert storage_path(output).read_bytes() == OUTPUT
+    for width in RESIZE_WIDTHS:
+        assert storage_path(thumbnail_key(person, width)).exists()
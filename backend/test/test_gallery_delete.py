@@ -0,0 +1,62 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import Base, get_async_db
+from schemas.user import User, TryOnImage
+from routers import gallery
+from utils.security import create_access_token
+import pytest
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The gallery routes on a fresh SQLite database, with alice and bob each owning one try-on"""
+    monkeypatch.chdir(tmp_path)
+    db_file = tmp_path / "gallery.db"
+    sync_engine = create_engine(f"sqlite:///{db_file}")
+    Base.metadata.create_all(sync_engine)
+    with Session(sync_engine) as db:
+        for username in ("alice", "bob"):
+            user = User(name=username, username=username, password="x", role=0)
+            db.add(user)
+            db.flush()
+            db.add(TryOnImage(userid=user.id, personimagepath="", clothimagepath="", outputimagepath=""))
+        db.commit()
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}")
+    session = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def override_db():
+        async with session() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(gallery.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = override_db
+    with TestClient(app) as test_client:
+        yield test_client
+
+def bearer(user_id, username):
+    return {"Authorization": f"Bearer {create_access_token(user_id, username, 0)}"}
+
+def test_delete_without_token_is_401(client):
+    response = client.delete("/api/gallery/2", params={"username": "bob"})
+    assert response.status_code == 401
+
+    # Still there for its owner
+    assert [item["id"] for item in client.get("/api/gallery", headers=bearer(2, "bob")).json()["gallery"]] == [2]
+
+def test_delete_with_forged_token_is_401(client):
+    payload = create_access_token(1, "alice", 0).split(".")[0]
+    response = client.delete("/api/gallery/2", headers={"Authorization": f"Bearer {payload}.forged"})
+    assert response.status_code == 401
+
+def test_delete_of_someone_elses_item_is_404(client):
+    response = client.delete("/api/gallery/2", headers=bearer(1, "alice"))
+    assert response.status_code == 404
+
+    response = client.delete("/api/gallery/1", headers=bearer(1, "alice"))
+    assert response.status_code == 200
+    assert client.get("/api/gallery", headers=bearer(1, "alice")).json()["gallery"] == []
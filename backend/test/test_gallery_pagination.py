@@ -0,0 +1,51 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import Base
+from schemas.user import User, TryOnImage
+from routers.gallery import paginate, encode_cursor, decode_cursor
+import asyncio
+import base64
+import pytest
+
+def test_gallery_pages_through_rows_with_equal_timestamps(tmp_path):
+    # Rows inserted within one second share createdat as SQLite stores it
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'gallery.db'}")
+    session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with session() as db:
+            user = User(username="alice", role=0)
+            db.add(user)
+            await db.flush()
+            db.add_all([
+                TryOnImage(userid=user.id, personimagepath="p", clothimagepath="c", outputimagepath="o")
+                for _ in range(5)
+            ])
+            await db.commit()
+
+            stmt = select(TryOnImage.id, TryOnImage.createdat).where(TryOnImage.userid == user.id)
+            seen, cursor, pages = [], None, 0
+            while True:
+                rows, cursor = await paginate(db, stmt, cursor, limit=2)
+                seen += [row.id for row in rows]
+                pages += 1
+                if cursor is None or pages > 5:
+                    break
+
+        await engine.dispose()
+        return seen, pages
+
+    seen, pages = asyncio.run(run())
+    assert seen == [5, 4, 3, 2, 1]
+    assert pages == 3
+
+def test_gallery_cursor_is_the_id_alone():
+    assert decode_cursor(encode_cursor(42)) == 42
+
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(base64.urlsafe_b64encode(b"2025-01-01T10:00:00|42").decode("ascii"))
+    assert error.value.status_code == 400
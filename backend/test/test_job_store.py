@@ -0,0 +1,20 @@
+from fastapi import HTTPException
+from utils import jobs
+import pytest
+
+def test_job_routes_answer_503_when_another_process_holds_the_store(tmp_path, monkeypatch):
+    lock_file = str(tmp_path / "jobs.lock")
+    monkeypatch.setattr(jobs, "_process_lock", None)
+    assert jobs.claim_job_store_process(lock_file) is True
+    jobs.require_job_store()
+
+    # Stands in for a second worker process: the lock is taken elsewhere
+    owner = jobs._process_lock
+    monkeypatch.setattr(jobs, "_process_lock", None)
+    try:
+        assert jobs.claim_job_store_process(lock_file) is False
+        with pytest.raises(HTTPException) as error:
+            jobs.require_job_store()
+        assert error.value.status_code == 503
+    finally:
+        owner.close()
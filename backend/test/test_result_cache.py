@@ -0,0 +1,39 @@
+from utils.result_cache import TryOnResultCache
+import asyncio
+
+def test_result_cache_memory_and_disk_tiers(tmp_path):
+    cache = TryOnResultCache(directory=tmp_path, ttl_seconds=60, max_memory_items=1)
+    first = cache.make_key("external", "person", "cloth")
+    second = cache.make_key("external", "person", "other-cloth")
+
+    async def run():
+        await cache.set(first, b"first_output", "image/png")
+        await cache.set(second, b"second_output", "image/webp")
+
+        # With a single memory slot each lookup below is served from disk
+        assert await cache.get(first) == (b"first_output", "image/png")
+        assert await cache.get(second) == (b"second_output", "image/webp")
+        assert await cache.get(cache.make_key("openai", "person", "cloth")) is None
+
+    asyncio.run(run())
+
+    stats = cache.stats()
+    assert stats["disk_hits"] == 2
+    assert stats["misses"] == 1
+
+def test_result_cache_key_depends_on_params():
+    base = TryOnResultCache.make_key("openai", "p", "c", {"style": "casual"})
+    assert base == TryOnResultCache.make_key("openai", "p", "c", {"style": "casual"})
+    assert base != TryOnResultCache.make_key("openai", "p", "c", {"style": "formal"})
+
+def test_result_cache_overwrite_keeps_disk_size(tmp_path):
+    cache = TryOnResultCache(directory=tmp_path, ttl_seconds=60)
+    key = cache.make_key("external", "person", "cloth")
+
+    async def run():
+        await cache.set(key, b"first_output", "image/png")
+        await cache.set(key, b"second_output_longer", "image/png")
+        await cache.set(key, b"third", "image/png")
+
+    asyncio.run(run())
+    assert cache._disk_bytes == len(b"third")
@@ -0,0 +1,48 @@
+from routers.tryon import run_providers
+import asyncio
+
+def test_preferred_mode_returns_first_success_and_cancels_the_rest():
+    cancelled = []
+
+    async def fast():
+        await asyncio.sleep(0.01)
+        return "data:image/png;base64,RkFTVA=="
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("external")
+            raise
+        return "data:image/png;base64,U0xPVw=="
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        results = await run_providers(
+            {"openai": (fast(), 5), "external": (slow(), 5)},
+            preferred="openai",
+            wait_mode="preferred"
+        )
+        return results, asyncio.get_running_loop().time() - started
+
+    results, elapsed = asyncio.run(run())
+    assert elapsed < 1
+    assert results["openai"] == {"success": True, "image": "data:image/png;base64,RkFTVA==", "error": None}
+    assert results["external"]["success"] is None
+    assert cancelled == ["external"]
+
+def test_preferred_mode_waits_for_the_others_when_the_preferred_fails():
+    async def failing():
+        raise RuntimeError("provider down")
+
+    async def slower():
+        await asyncio.sleep(0.05)
+        return "data:image/png;base64,U0xPVw=="
+
+    results = asyncio.run(run_providers(
+        {"openai": (failing(), 5), "external": (slower(), 5)},
+        preferred="openai",
+        wait_mode="preferred"
+    ))
+    assert results["openai"] == {"success": False, "image": None, "error": "provider down"}
+    assert results["external"]["success"] is True
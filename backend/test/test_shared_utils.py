@@ -0,0 +1,15 @@
+from pathlib import Path
+import pytest
+
+BACKEND_UTILS = Path(__file__).resolve().parent.parent / "utils"
+WORKER_UTILS = BACKEND_UTILS.parent.parent / "Virtual-TryOn-Backend" / "utils"
+
+# Modules both services carry a copy of
+SHARED_MODULES = ["uploads.py", "image_preprocess.py", "jobs.py", "metrics.py"]
+
+@pytest.mark.skipif(not WORKER_UTILS.is_dir(), reason="Virtual-TryOn-Backend is not checked out alongside")
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_shared_utils_are_identical(name):
+    assert (BACKEND_UTILS / name).read_text() == (WORKER_UTILS / name).read_text(), (
+        f"backend/utils/{name} and Virtual-TryOn-Backend/utils/{name} have diverged; apply the change to both"
+    )
@@ -0,0 +1,139 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from routers import tryon
+from utils import jobs
+from utils.uploads import BodySizeLimitMiddleware
+import asyncio
+import io
+import json
+import time
+import pytest
+
+def jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 50), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def try_on_files(person=None, cloth=None):
+    return {
+        "person_image": ("person.jpg", person or jpeg("red"), "image/jpeg"),
+        "cloth_image": ("cloth.jpg", cloth or jpeg("blue"), "image/jpeg")
+    }
+
+@pytest.fixture
+def openai_calls(monkeypatch):
+    """Stub the OpenAI provider; a call whose instructions say "slow" waits for 10s"""
+    calls = []
+
+    async def fake_openai(prompt, cache_key=None):
+        calls.append(prompt)
+        await asyncio.sleep(10 if "slow" in prompt else 0.05)
+        return "data:image/png;base64,T1BFTkFJ"
+
+    monkeypatch.setattr(tryon, "generate_openai_image", fake_openai)
+    return calls
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, openai_calls):
+    # This process holds the job store, as the startup hook would do
+    monkeypatch.setattr(jobs, "_process_lock", None)
+    jobs.claim_job_store_process(str(tmp_path / "jobs.lock"))
+    monkeypatch.setattr(jobs, "job_store", jobs.JobStore())
+    monkeypatch.setattr(tryon, "job_store", jobs.job_store)
+
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_mb=1)
+    app.include_router(tryon.router, prefix="/api")
+    with TestClient(app) as test_client:
+        yield test_client
+    jobs._process_lock.close()
+
+def sse_events(client, url):
+    """(event, data) pairs of a server-sent event stream, read until it closes"""
+    events = []
+    with client.stream("GET", url) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                events.append((event, json.loads(line[len("data:"):])))
+    return events
+
+def test_job_submit_poll_and_sse_until_completed(client):
+    response = client.post("/api/try-on/jobs", files=try_on_files(), data={"model_type": "dress"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert job["events_url"] == f"/api/try-on/jobs/{job['job_id']}/events"
+
+    events = sse_events(client, job["events_url"])
+    assert events[-1][0] == "completed"
+    assert events[-1][1]["progress"]["providers"] == {"openai": "succeeded"}
+    assert all(event == "status" for event, _ in events[:-1])
+
+    finished = client.get(job["status_url"]).json()
+    assert finished["status"] == "completed"
+    assert finished["result"]["openai_image"] == "data:image/png;base64,T1BFTkFJ"
+
+def test_job_cancel(client):
+    job = client.post(
+        "/api/try-on/jobs",
+        files=try_on_files(),
+        data={"model_type": "dress", "instructions": "slow"}
+    ).json()
+
+    assert client.delete(job["status_url"]).json() == {"job_id": job["job_id"], "status": "cancelling"}
+    deadline = time.time() + 5
+    while client.get(job["status_url"]).json()["status"] != "cancelled":
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+    assert sse_events(client, job["events_url"])[-1][0] == "cancelled"
+    assert client.get("/api/try-on/jobs/unknown").status_code == 404
+
+def test_batch_streams_one_ndjson_line_per_pair(client, monkeypatch):
+    shared_uploads = []
+
+    async def fake_external(person_bytes, cloth_bytes, person_content_type, cloth_content_type, username,
+                            cache_key=None, background_tasks=None, preprocessed=None, on_progress=None):
+        shared_uploads.append(preprocessed is not None)
+        return "data:image/png;base64,RVhURVJOQUw="
+
+    monkeypatch.setattr(tryon, "call_external_tryon_backend", fake_external)
+    files = [("person_images", ("person.jpg", jpeg("red"), "image/jpeg"))] + [
+        ("cloth_images", (f"cloth{i}.jpg", jpeg(color), "image/jpeg"))
+        for i, color in enumerate(("blue", "green", "white"))
+    ]
+
+    with client.stream("POST", "/api/try-on/batch", files=files, data={"model_type": "top"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.headers["x-tryon-batch-size"] == "3"
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert sorted(line["cloth_index"] for line in lines) == [0, 1, 2]
+    assert all(line["status_code"] == 200 for line in lines)
+    assert all(line["result"]["external_image"] == "data:image/png;base64,RVhURVJOQUw=" for line in lines)
+    # Each image was preprocessed once for all pairs
+    assert shared_uploads == [True, True, True]
+
+def test_oversized_body_gets_413_from_the_middleware(client, openai_calls):
+    response = client.post(
+        "/api/try-on",
+        files=try_on_files(person=b"\xff\xd8\xff" + b"\0" * (2 * 1024 * 1024)),
+        data={"model_type": "dress"}
+    )
+    assert response.status_code == 413
+    assert openai_calls == []
+
+def test_sniffed_gif_gets_400_despite_its_declared_type(client, openai_calls):
+    gif = io.BytesIO()
+    Image.new("RGB", (40, 50), "red").save(gif, "GIF")
+    response = client.post("/api/try-on", files=try_on_files(person=gif.getvalue()), data={"model_type": "dress"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unsupported person image type"
+    assert openai_calls == []
@@ -0,0 +1,212 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from pathlib import PurePosixPath
+from typing import List, NamedTuple
+from sqlalchemy import update, delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas.user import Blob, TryOnImage
+from utils.storage import UPLOADS_DIR, storage_path
+from utils.thumbnails import thumbnail_key, RESIZE_WIDTHS
+from utils.uploads import sniff_image_type
+
+BLOBS_PREFIX = "blobs"
+# Files of blobs being deleted wait here until the deleting transaction commits
+BLOB_TRASH_DIR = UPLOADS_DIR / BLOBS_PREFIX / ".trash"
+
+BLOB_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+class BlobRef(NamedTuple):
+    sha256: str
+    key: str
+    size: int
+
+def blob_key(digest: str, extension: str) -> str:
+    """Sharded storage key of a blob, e.g. blobs/ab/cd/abcd....jpg"""
+    return f"{BLOBS_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+def is_blob_key(key: str) -> bool:
+    return key.startswith(f"{BLOBS_PREFIX}/")
+
+def blob_digest(key: str) -> str:
+    return PurePosixPath(key).stem
+
+def describe_blob(data: bytes) -> BlobRef:
+    """Hash `data` and work out its storage key; runs in a worker thread"""
+    digest = hashlib.sha256(data).hexdigest()
+    extension = BLOB_EXTENSIONS.get(sniff_image_type(data[:12]), "bin")
+    return BlobRef(digest, blob_key(digest, extension), len(data))
+
+def write_blob_files(blobs: List[BlobRef], contents: List[bytes]):
+    """Write every blob file that is not on disk yet; runs in a worker thread"""
+    for blob, data in zip(blobs, contents):
+        path = storage_path(blob.key)
+        if path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name so concurrent writers of the same blob do not collide
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+def increment_refs(db: Session, blobs: List[BlobRef]):
+    """
+    Add one reference per entry of `blobs`, creating missing rows.
+
+    The UPDATE (or INSERT) locks the row until the caller commits, which keeps
+    a concurrent `release_refs` from deleting the file in between.
+    """
+    for blob in blobs:
+        increment = update(Blob).where(Blob.sha256 == blob.sha256).values(refcount=Blob.refcount + 1)
+        if db.execute(increment).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(Blob(sha256=blob.sha256, storagekey=blob.key, size=blob.size, refcount=1))
+        except IntegrityError:
+            # Another request created the row first
+            db.execute(increment)
+
+def release_refs(db: Session, keys: List[str]) -> List[str]:
+    """
+    Drop one reference per blob key and delete rows that reach zero.
+
+    Returns the storage keys whose files are no longer referenced; the caller
+    removes them once the transaction commits.
+    """
+    unreferenced = []
+    for key in keys:
+        digest = blob_digest(key)
+        db.execute(update(Blob).where(Blob.sha256 == digest).values(refcount=Blob.refcount - 1))
+        refcount = db.scalar(select(Blob.refcount).where(Blob.sha256 == digest))
+        if refcount is not None and refcount <= 0:
+            db.execute(delete(Blob).where(Blob.sha256 == digest))
+            unreferenced.append(key)
+    return unreferenced
+
+def file_and_thumbnail_paths(key: str):
+    return [storage_path(key)] + [storage_path(thumbnail_key(key, width)) for width in RESIZE_WIDTHS]
+
+def trash_files(keys: List[str]) -> List[tuple]:
+    """Move the files of `keys` (and their thumbnails) aside; returns (original, trashed) pairs"""
+    BLOB_TRASH_DIR.mkdir(parents=True, exist_ok=True)
+    moved = []
+    for key in keys:
+        for path in file_and_thumbnail_paths(key):
+            if path.exists():
+                trashed = BLOB_TRASH_DIR / f"{uuid.uuid4().hex}_{path.name}"
+                os.replace(path, trashed)
+                moved.append((path, trashed))
+    return moved
+
+def empty_trash(moved: List[tuple]):
+    for _, trashed in moved:
+        trashed.unlink(missing_ok=True)
+
+def restore_trash(moved: List[tuple]):
+    for original, trashed in moved:
+        os.replace(trashed, original)
+
+async def acquire_blobs(db: AsyncSession, contents: List[bytes]) -> List[str]:
+    """
+    Store `contents` in the blob store and reference each once.
+
+    Returns their storage keys, in order. Identical bytes map to the same
+    file however many rows use them. The caller commits.
+    """
+    blobs = await asyncio.to_thread(lambda: [describe_blob(data) for data in contents])
+    await db.run_sync(increment_refs, blobs)
+    # Written after the rows are locked, so a file deleted by a concurrent
+    # release is put back before this transaction commits
+    await asyncio.to_thread(write_blob_files, blobs, contents)
+    return [blob.key for blob in blobs]
+
+async def delete_try_on_image(db: AsyncSession, image: TryOnImage):
+    """
+    Delete a try-on row, releasing its blobs and removing files nobody else uses.
+
+    Files are moved aside before the commit and only deleted after it, so a
+    failed commit leaves the store untouched. Legacy per-directory files
+    belong to this row alone and are removed outright.
+    """
+    keys = [image.personimagepath, image.clothimagepath, image.outputimagepath]
+    blob_keys = [key for key in keys if is_blob_key(key)]
+    legacy_keys = [key for key in keys if key and not is_blob_key(key)]
+
+    unreferenced = await db.run_sync(release_refs, blob_keys)
+    await db.delete(image)
+
+    moved = await asyncio.to_thread(trash_files, unreferenced + legacy_keys)
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await asyncio.to_thread(restore_trash, moved)
+        raise
+    await asyncio.to_thread(empty_trash, moved)
+
+def migrate_legacy_uploads(db: Session) -> int:
+    """
+    Move try-on files saved under uploads/users/<username>/tryon_<id>/ into
+    the blob store, one row per transaction.
+
+    Rows whose files are missing keep their old path. Run from a single
+    process (see migrate_blobs.py); re-running it afterwards is a no-op.
+    Returns the number of rows migrated.
+    """
+    legacy = db.query(TryOnImage).filter(
+        ~TryOnImage.personimagepath.like(f"{BLOBS_PREFIX}/%")
+        | ~TryOnImage.clothimagepath.like(f"{BLOBS_PREFIX}/%")
+        | ~TryOnImage.outputimagepath.like(f"{BLOBS_PREFIX}/%")
+    ).all()
+
+    migrated = 0
+    for image in legacy:
+        columns = ("personimagepath", "clothimagepath", "outputimagepath")
+        old_keys = {}
+        for column in columns:
+            key = getattr(image, column)
+            if key and not is_blob_key(key) and storage_path(key).is_file():
+                old_keys[column] = key
+        if not old_keys:
+            continue
+
+        contents = [storage_path(key).read_bytes() for key in old_keys.values()]
+        blobs = [describe_blob(data) for data in contents]
+        increment_refs(db, blobs)
+        write_blob_files(blobs, contents)
+        for column, blob in zip(old_keys, blobs):
+            setattr(image, column, blob.key)
+
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[ERROR] Migrating try-on {image.id} to the blob store failed: {str(e)}")
+            continue
+
+        migrated += 1
+        for key in old_keys.values():
+            for path in file_and_thumbnail_paths(key):
+                path.unlink(missing_ok=True)
+            remove_empty_dirs(PurePosixPath(key).parent)
+
+    if migrated:
+        print(f"Moved {migrated} try-on rows into the blob store")
+    return migrated
+
+def remove_empty_dirs(key_dir: PurePosixPath):
+    """Remove a legacy try-on directory (and its thumbs/) once it is empty"""
+    for directory in (storage_path(str(key_dir / "thumbs")), storage_path(str(key_dir))):
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
@@ -0,0 +1,67 @@
+import os
+from typing import Optional
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connection pool for the backend -> Virtual-TryOn-Backend hop. One client lives
+# for the whole app lifetime so connections are kept alive and reused.
+HTTP_MAX_CONNECTIONS = int(os.getenv("EXTERNAL_HTTP_MAX_CONNECTIONS") or 100)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("EXTERNAL_HTTP_MAX_KEEPALIVE_CONNECTIONS") or 20)
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("EXTERNAL_HTTP_KEEPALIVE_EXPIRY_SECONDS") or 30)
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("EXTERNAL_HTTP_CONNECT_TIMEOUT_SECONDS") or 5)
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("EXTERNAL_HTTP_READ_TIMEOUT_SECONDS") or 120)
+HTTP_POOL_TIMEOUT_SECONDS = float(os.getenv("EXTERNAL_HTTP_POOL_TIMEOUT_SECONDS") or 10)
+HTTP2_ENABLED = os.getenv("EXTERNAL_HTTP2") == "true"
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def build_http_client() -> httpx.AsyncClient:
+    """Build the pooled async client from the environment settings"""
+    http2 = HTTP2_ENABLED
+    if http2 and not _http2_available():
+        print("EXTERNAL_HTTP2 is enabled but the 'h2' package is missing, falling back to HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+        ),
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT_SECONDS,
+            read=HTTP_READ_TIMEOUT_SECONDS,
+            write=HTTP_READ_TIMEOUT_SECONDS,
+            pool=HTTP_POOL_TIMEOUT_SECONDS
+        )
+    )
+
+async def start_http_client():
+    """Create the shared client, called from the app startup hook"""
+    global _client
+    if _client is None:
+        _client = build_http_client()
+
+async def close_http_client():
+    """Close the shared client and its pooled connections on shutdown"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if startup did not run"""
+    global _client
+    if _client is None:
+        _client = build_http_client()
+    return _client
@@ -0,0 +1,217 @@
+# Shared by backend/utils and Virtual-TryOn-Backend/utils; keep both copies
+# identical (checked by backend/test/test_shared_utils.py)
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import HTTPException
+from utils.metrics import registry, Gauge
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs (and their results) are kept this long for polling clients
+TRYON_JOB_TTL_SECONDS = float(os.getenv("TRYON_JOB_TTL_SECONDS") or 600)
+# Upper bound on retained jobs; the oldest finished ones are dropped first
+TRYON_JOB_MAX_ENTRIES = int(os.getenv("TRYON_JOB_MAX_ENTRIES") or 200)
+# How often the event stream re-checks a job (queue position moves without notice)
+TRYON_JOB_EVENTS_POLL_SECONDS = float(os.getenv("TRYON_JOB_EVENTS_POLL_SECONDS") or 1)
+# Idle event streams send a comment this often so proxies keep them open
+TRYON_JOB_KEEPALIVE_SECONDS = float(os.getenv("TRYON_JOB_KEEPALIVE_SECONDS") or 15)
+# Held for the life of the process serving jobs; other processes (e.g. from
+# `--workers 2`) find it locked and answer 503 on the job routes only
+TRYON_JOB_LOCK_FILE = os.getenv("TRYON_JOB_LOCK_FILE") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tryon-jobs.lock"
+)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+class Job:
+    """A submitted try-on; `result` and `error` are set once it finishes"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.progress: dict = {}
+        # Optional callable returning live progress, e.g. the queue position
+        self.progress_fn: Optional[Callable[[], dict]] = None
+        self.result: Any = None
+        self.error: Optional[dict] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def update(self, status: Optional[str] = None, **progress):
+        if status:
+            self.status = status
+        self.progress.update(progress)
+        self._changed.set()
+
+    def snapshot(self) -> dict:
+        """JSON-safe status of the job, without the result"""
+        progress = dict(self.progress)
+        if self.progress_fn and self.status not in JOB_FINISHED_STATES:
+            progress.update(self.progress_fn())
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "progress": progress,
+            "error": self.error
+        }
+
+class JobStore:
+    """
+    In-memory registry of asynchronous try-on jobs.
+
+    Each job runs as an asyncio task in this process; results are held in
+    memory until TRYON_JOB_TTL_SECONDS after the job finishes.
+    """
+
+    def __init__(self, ttl_seconds: float = TRYON_JOB_TTL_SECONDS, max_entries: int = TRYON_JOB_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def submit(self, run: Callable[[Job], Awaitable[Any]]) -> Job:
+        """Start `run(job)` in the background and return the job"""
+        self._prune()
+        job = Job()
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[Any]]):
+        try:
+            job.result = await run(job)
+            status = JOB_COMPLETED
+        except asyncio.CancelledError:
+            status = JOB_CANCELLED
+        except HTTPException as e:
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+            status = JOB_FAILED
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.error = {"status_code": 500, "detail": "Internal server error. Please try again later."}
+            status = JOB_FAILED
+        job.finished_at = time.time()
+        job.update(status)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job and job.task and not job.task.done():
+            job.task.cancel()
+        return job
+
+    def status_counts(self) -> dict:
+        """Retained jobs per status, as {(status,): count} for the jobs gauge"""
+        counts = {}
+        for job in self._jobs.values():
+            counts[(job.status,)] = counts.get((job.status,), 0) + 1
+        return counts
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at >= self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        if len(self._jobs) > self.max_entries:
+            finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+            for job_id in finished[:len(self._jobs) - self.max_entries]:
+                del self._jobs[job_id]
+
+    async def events(self, job: Job, poll_seconds: float = TRYON_JOB_EVENTS_POLL_SECONDS):
+        """
+        Server-sent events for a job: `status` whenever its snapshot changes,
+        then one final event named after the finished state.
+        """
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            job._changed.clear()
+            snapshot = job.snapshot()
+            if snapshot["status"] in JOB_FINISHED_STATES:
+                yield sse_event(snapshot["status"], snapshot)
+                return
+            if snapshot != last:
+                yield sse_event("status", snapshot)
+                last = snapshot
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= TRYON_JOB_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+            try:
+                await asyncio.wait_for(job._changed.wait(), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+_process_lock = None
+
+def claim_job_store_process(path: str = TRYON_JOB_LOCK_FILE) -> bool:
+    """
+    Try to become the one process serving jobs; returns whether it did.
+
+    Jobs and their results live in this process's memory, so with several
+    worker processes a status or events request landing on another one
+    would answer 404. Only the lock holder serves the job routes; the
+    others keep serving everything else (see require_job_store).
+    """
+    global _process_lock
+    if _process_lock is not None:
+        return True
+
+    handle = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        logger.warning(
+            f"Another process holds {path}: the try-on job store is in-memory, "
+            "so the job routes of this process answer 503"
+        )
+        return False
+    _process_lock = handle
+    return True
+
+def require_job_store():
+    """Dependency of the job routes: 503 in a process that does not hold the job store"""
+    if _process_lock is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Try-on jobs are not served by this worker process. Run a single worker "
+                   "process, or use the blocking endpoint."
+        )
+
+# Global job store instance
+job_store = JobStore()
+registry.register(Gauge("tryon_jobs", "Try-on jobs held by the job store, by status", ("status",), fn=job_store.status_counts))
@@ -0,0 +1,232 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+from utils.metrics import CACHE_HITS, CACHE_MISSES
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRYON_CACHE_ENABLED = (os.getenv("TRYON_CACHE_ENABLED") or "true") == "true"
+TRYON_CACHE_DIR = Path(os.getenv("TRYON_CACHE_DIR") or "uploads/cache/tryon")
+TRYON_CACHE_TTL_SECONDS = float(os.getenv("TRYON_CACHE_TTL_SECONDS") or 24 * 3600)
+TRYON_CACHE_MEMORY_ITEMS = int(os.getenv("TRYON_CACHE_MEMORY_ITEMS") or 64)
+TRYON_CACHE_MEMORY_MB = float(os.getenv("TRYON_CACHE_MEMORY_MB") or 256)
+TRYON_CACHE_DISK_MB = float(os.getenv("TRYON_CACHE_DISK_MB") or 2048)
+
+MEDIA_TYPE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+}
+EXTENSION_MEDIA_TYPES = {ext: media_type for media_type, ext in MEDIA_TYPE_EXTENSIONS.items()}
+
+class TryOnResultCache:
+    """
+    Content-addressed cache of provider outputs.
+
+    Entries live in an in-memory LRU (bounded by item count and bytes) backed
+    by an on-disk tier (bounded by total bytes). Both tiers expire entries
+    after `ttl_seconds`. Disk access runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        directory: Path = TRYON_CACHE_DIR,
+        ttl_seconds: float = TRYON_CACHE_TTL_SECONDS,
+        max_memory_items: int = TRYON_CACHE_MEMORY_ITEMS,
+        max_memory_bytes: int = int(TRYON_CACHE_MEMORY_MB * 1024 * 1024),
+        max_disk_bytes: int = int(TRYON_CACHE_DISK_MB * 1024 * 1024),
+        enabled: bool = TRYON_CACHE_ENABLED
+    ):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_items = max_memory_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+
+        self._memory: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None  # computed lazily on first write
+        self._disk_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, person_digest: str, cloth_digest: str, params: Optional[dict] = None) -> str:
+        """Build the cache key from the provider, input digests and parameters"""
+        h = hashlib.sha256()
+        h.update(provider.encode("utf-8"))
+        h.update(person_digest.encode("utf-8"))
+        h.update(cloth_digest.encode("utf-8"))
+        for name, value in sorted((params or {}).items()):
+            h.update(f"\0{name}={value}".encode("utf-8"))
+        return h.hexdigest()
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return (image_bytes, media_type) for a cached result, or None"""
+        if not self.enabled:
+            return None
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            data, media_type, stored_at = entry
+            if time.time() - stored_at < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                CACHE_HITS.inc(cache="tryon")
+                return data, media_type
+            self._drop_memory(key)
+
+        found = await asyncio.to_thread(self._read_disk, key)
+        if found is None:
+            self.misses += 1
+            CACHE_MISSES.inc(cache="tryon")
+            return None
+
+        data, media_type, stored_at = found
+        self._store_memory(key, data, media_type, stored_at)
+        self.disk_hits += 1
+        CACHE_HITS.inc(cache="tryon")
+        return data, media_type
+
+    async def set(self, key: str, data: bytes, media_type: str):
+        """Store a result in both tiers"""
+        if not self.enabled or not data:
+            return
+
+        self._store_memory(key, data, media_type, time.time())
+        await asyncio.to_thread(self._write_disk, key, data, media_type)
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes
+        }
+
+    # ---- memory tier ----
+
+    def _store_memory(self, key: str, data: bytes, media_type: str, stored_at: float):
+        if len(data) > self.max_memory_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = (data, media_type, stored_at)
+        self._memory_bytes += len(data)
+
+        while self._memory and (
+            len(self._memory) > self.max_memory_items or
+            self._memory_bytes > self.max_memory_bytes
+        ):
+            _, (old_data, _, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            self.evictions += 1
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[0])
+
+    # ---- disk tier ----
+
+    def _disk_path(self, key: str, media_type: str) -> Path:
+        ext = MEDIA_TYPE_EXTENSIONS.get(media_type, "bin")
+        return self.directory / key[:2] / f"{key}.{ext}"
+
+    def _read_disk(self, key: str) -> Optional[Tuple[bytes, str, float]]:
+        shard = self.directory / key[:2]
+        for ext, media_type in EXTENSION_MEDIA_TYPES.items():
+            path = shard / f"{key}.{ext}"
+            try:
+                stored_at = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+
+            if time.time() - stored_at >= self.ttl_seconds:
+                self._unlink(path)
+                return None
+
+            try:
+                return path.read_bytes(), media_type, stored_at
+            except FileNotFoundError:
+                return None
+        return None
+
+    def _write_disk(self, key: str, data: bytes, media_type: str):
+        path = self._disk_path(key, media_type)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temp file first so readers never see a partial image
+        tmp_path = path.with_suffix(path.suffix + f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+
+        with self._disk_lock:
+            # Overwriting an entry (e.g. a re-run of the same inputs) only
+            # changes the total by the size difference
+            try:
+                replaced_bytes = path.stat().st_size
+            except FileNotFoundError:
+                replaced_bytes = 0
+            os.replace(tmp_path, path)
+
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(f.stat().st_size for f in self._disk_files())
+            else:
+                self._disk_bytes += len(data) - replaced_bytes
+
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _disk_files(self):
+        if not self.directory.exists():
+            return []
+        return [f for f in self.directory.glob("*/*") if f.is_file() and not f.name.endswith(".tmp")]
+
+    def _evict_disk(self):
+        """Remove expired entries, then the oldest ones until under 90% of the limit"""
+        now = time.time()
+        files = []
+        for f in self._disk_files():
+            try:
+                files.append((f.stat().st_mtime, f.stat().st_size, f))
+            except FileNotFoundError:
+                continue
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        for mtime, size, f in files:
+            if total <= target and now - mtime < self.ttl_seconds:
+                continue
+            if self._unlink(f):
+                total -= size
+                self.evictions += 1
+
+        self._disk_bytes = total
+
+    @staticmethod
+    def _unlink(path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+# Shared cache instance used by the try-on router
+tryon_cache = TryOnResultCache()
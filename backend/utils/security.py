@@ -1,11 +1,46 @@
+import os
+import time
+import json
+import hmac
+import base64
+import hashlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# bcrypt work factor; hashes below it are upgraded on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS") or 12)
+# Threads dedicated to hashing so a login burst cannot starve other work
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or 2)
 
 # Use bcrypt as the hashing algorithm
 # deprecated="auto" If an old or weak hash is detected, automatically mark it as outdated
 
 pwd_context = CryptContext(
     schemes=["bcrypt"],
-    deprecated="auto"
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS
+)
+
+# Secret used to sign session tokens; required, so tokens survive restarts and
+# nobody can sign them with the placeholder from .env.example
+AUTH_SECRET_KEY_PLACEHOLDER = "change-me"
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
+if not AUTH_SECRET_KEY or AUTH_SECRET_KEY == AUTH_SECRET_KEY_PLACEHOLDER:
+    raise ValueError(
+        "Set AUTH_SECRET_KEY in .env to a random secret, e.g. the output of: "
+        "python -c \"import secrets; print(secrets.token_urlsafe(32))\""
+    )
+AUTH_TOKEN_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_TTL_SECONDS") or 12 * 3600)
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
 )
 
 def hash_password(password: str) -> str:
@@ -15,3 +50,52 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hash_password: str) -> bool:
     safe_password = plain_password.encode("utf-8")[:72]
     return pwd_context.verify(safe_password, hash_password)
+
+def verify_and_update_password(plain_password: str, hash_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a new hash when the stored one is outdated"""
+    safe_password = plain_password.encode("utf-8")[:72]
+    return pwd_context.verify_and_update(safe_password, hash_password)
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the bounded hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_and_update_password_async(plain_password: str, hash_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password on the bounded hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_and_update_password, plain_password, hash_password)
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(AUTH_SECRET_KEY.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+def create_access_token(user_id: int, username: str, role: int) -> str:
+    """Issue an HMAC-SHA256 signed token carrying the user id, username and role"""
+    claims = {
+        "sub": user_id,
+        "username": username,
+        "role": role,
+        "exp": int(time.time()) + AUTH_TOKEN_TTL_SECONDS
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+def decode_access_token(token: str) -> Optional[dict]:
+    """Return the claims of a valid, unexpired token, or None"""
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+
+    if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+        return None
+    return claims
@@ -0,0 +1,54 @@
+from pathlib import Path, PurePosixPath
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from schemas.user import TryOnImage
+
+# Everything under this directory is served by the StaticFiles mount at /uploads
+UPLOADS_DIR = Path("uploads")
+
+def to_storage_key(path) -> str:
+    """
+    Normalise a file path to a storage key relative to uploads/.
+
+    Accepts paths written on Windows (backslashes) and paths that still carry
+    the leading "uploads" directory, e.g. "uploads\\users\\a\\tryon_1\\person.jpg"
+    becomes "users/a/tryon_1/person.jpg".
+    """
+    parts = [p for p in str(path).replace("\\", "/").split("/") if p not in ("", ".")]
+    if parts and parts[0] == UPLOADS_DIR.name:
+        parts = parts[1:]
+    return str(PurePosixPath(*parts)) if parts else ""
+
+def storage_path(key: str) -> Path:
+    """Local filesystem path of a storage key"""
+    return UPLOADS_DIR / key
+
+def storage_url(backend_url: str, key: str) -> str:
+    """Public URL of a storage key"""
+    return f"{backend_url}/uploads/{key}"
+
+def normalise_legacy_paths(db: Session) -> int:
+    """
+    Rewrite try-on rows saved before storage keys were introduced.
+
+    Only rows with a leading "uploads" segment or backslashes are touched, so
+    this is cheap to run on every startup. Returns the number of rows fixed.
+    """
+    path_columns = (
+        TryOnImage.personimagepath,
+        TryOnImage.clothimagepath,
+        TryOnImage.outputimagepath,
+    )
+    legacy = db.query(TryOnImage).filter(or_(*(
+        condition
+        for column in path_columns
+        for condition in (column.like("uploads%"), column.contains("\\"))
+    ))).all()
+
+    for img in legacy:
+        img.personimagepath = to_storage_key(img.personimagepath)
+        img.clothimagepath = to_storage_key(img.clothimagepath)
+        img.outputimagepath = to_storage_key(img.outputimagepath)
+
+    db.commit()
+    return len(legacy)
@@ -0,0 +1,78 @@
+import os
+import uuid
+import asyncio
+from pathlib import PurePosixPath
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from utils.storage import storage_path
+
+load_dotenv()
+
+# Widths generated for every saved try-on image
+THUMBNAIL_WIDTHS = tuple(
+    int(w) for w in (os.getenv("THUMBNAIL_WIDTHS") or "160,320,640").split(",")
+)
+# Widths the on-demand resize endpoint accepts; bounded so the cache stays small
+RESIZE_WIDTHS = tuple(sorted(set(THUMBNAIL_WIDTHS) | {
+    int(w) for w in (os.getenv("IMAGE_RESIZE_WIDTHS") or "1024").split(",")
+}))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY") or 80)
+
+def thumbnail_key(key: str, width: int) -> str:
+    """Storage key of a resized variant, e.g. users/a/tryon_1/thumbs/person_320.webp"""
+    path = PurePosixPath(key)
+    return str(path.parent / "thumbs" / f"{path.stem}_{width}.webp")
+
+def thumbnail_urls(backend_url: str, key: str) -> dict:
+    """Resize-endpoint URLs of every thumbnail width for a storage key"""
+    return {
+        str(width): f"{backend_url}/api/images/{width}/{key}"
+        for width in THUMBNAIL_WIDTHS
+    }
+
+def resize_image(key: str, width: int) -> str:
+    """
+    Write a WebP variant of `key` at `width` and return its storage key.
+
+    Images narrower than `width` are re-encoded at their own size. Runs
+    synchronously; call from a worker thread.
+    """
+    target_key = thumbnail_key(key, width)
+    target_path = storage_path(target_key)
+    if target_path.exists():
+        return target_key
+
+    with Image.open(storage_path(key)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name: the resize endpoint and generate_thumbnails may
+        # render the same variant at once
+        tmp_path = target_path.with_name(f"{target_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            image.save(tmp_path, format="WEBP", quality=THUMBNAIL_QUALITY, method=4)
+            if not target_path.exists():
+                os.replace(tmp_path, target_path)
+        finally:
+            # Left over when another writer published the variant first
+            tmp_path.unlink(missing_ok=True)
+
+    return target_key
+
+def generate_thumbnails(keys) -> None:
+    """Generate every configured thumbnail width for the given storage keys"""
+    for key in keys:
+        for width in THUMBNAIL_WIDTHS:
+            try:
+                resize_image(key, width)
+            except Exception as e:
+                print(f"[ERROR] Thumbnail {width}px for {key} failed: {str(e)}")
+
+async def resize_image_async(key: str, width: int) -> str:
+    return await asyncio.to_thread(resize_image, key, width)
@@ -1,57 +1,80 @@
-from pathlib import Path
+import os
+import asyncio
+from fastapi import BackgroundTasks
 from models.tryon_images import SaveTryOnImage
-from database import get_db
 from schemas.user import TryOnImage, User
-from database import SessionLocal
+from database import AsyncSessionLocal
+from sqlalchemy import select
+from utils.blob_store import acquire_blobs
+from utils.thumbnails import generate_thumbnails
+from utils.metrics import STAGE_SECONDS
+from dotenv import load_dotenv
 
-db = SessionLocal()
+load_dotenv()
 
-BASE_DIR = Path("uploads/users")
+# When enabled, try-on results are persisted after the response has been sent
+TRYON_SAVE_IN_BACKGROUND = (os.getenv("TRYON_SAVE_IN_BACKGROUND") or "true") == "true"
 
 async def save_try_on_images(data: SaveTryOnImage):
-    try:
-        user = db.query(User).filter(
-            User.username==data.username
-        ).first()
-
-        imageData = TryOnImage(
-            userid=user.id,
-            personimagepath="",
-            clothimagepath="",
-            outputimagepath=""
-        )
-
-        db.add(imageData)
-
-        db.flush()
-        
-        image_id = imageData.id
-        
-        try_ondir = BASE_DIR / data.username / f"tryon_{image_id}"
-
-        try_ondir.mkdir(parents=True, exist_ok=True)
-        
-        person_path = try_ondir / "person.jpg"
-        cloth_path = try_ondir / "cloth.jpg"
-        output_path = try_ondir / "output.png"
-
-        with open(person_path, "wb") as f:
-            f.write(data.person_bytes)
-        
-        with open(cloth_path, "wb") as f:
-            f.write(data.cloth_bytes)
-
-        with open(output_path, "wb") as f:
-            f.write(data.output_bytes)
-
-        imageData.personimagepath = str(person_path)
-        imageData.clothimagepath = str(cloth_path)
-        imageData.outputimagepath = str(output_path)
-
-        db.commit()
-
-        return "Images Successfully Saved"
-    
-    except Exception as e:
-        db.rollback()
-        return e
\ No newline at end of file
+    """
+    Persist one try-on with its own AsyncSession.
+
+    Images go to the content-addressed blob store, so a garment saved by
+    many try-ons is stored (and thumbnailed) once. Hashing, file writes and
+    thumbnail generation run in worker threads, so the event loop only waits
+    on the DB round-trips.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            # User lookup, blob files and refcounts, and the row itself
+            with STAGE_SECONDS.time(stage="db_save"):
+                user = await db.scalar(select(User).where(
+                    User.username==data.username
+                ))
+
+                if not user:
+                    return f"No user found for {data.username!r}, images not saved"
+
+                person_key, cloth_key, output_key = await acquire_blobs(db, [
+                    data.person_bytes,
+                    data.cloth_bytes,
+                    data.output_bytes
+                ])
+
+                # Path columns hold blob storage keys, relative to uploads/
+                imageData = TryOnImage(
+                    userid=user.id,
+                    personimagepath=person_key,
+                    clothimagepath=cloth_key,
+                    outputimagepath=output_key
+                )
+
+                db.add(imageData)
+
+                await db.commit()
+
+            with STAGE_SECONDS.time(stage="thumbnails"):
+                await asyncio.to_thread(generate_thumbnails, [
+                    imageData.personimagepath,
+                    imageData.clothimagepath,
+                    imageData.outputimagepath
+                ])
+
+            return "Images Successfully Saved"
+
+        except Exception as e:
+            await db.rollback()
+            print(f"[ERROR] Saving try-on images failed: {str(e)}")
+            return e
+
+async def persist_try_on_images(data: SaveTryOnImage, background_tasks: BackgroundTasks = None):
+    """
+    Persistence stage of a try-on request.
+
+    With `background_tasks` (and TRYON_SAVE_IN_BACKGROUND enabled) the save is
+    scheduled to run after the response is sent; otherwise it is awaited.
+    """
+    if background_tasks is not None and TRYON_SAVE_IN_BACKGROUND:
+        background_tasks.add_task(save_try_on_images, data)
+        return "Images scheduled for saving"
+    return await save_try_on_images(data)
@@ -0,0 +1,139 @@
+# Shared by backend/utils and Virtual-TryOn-Backend/utils; keep both copies
+# identical (checked by backend/test/test_shared_utils.py)
+import os
+import time
+import hashlib
+from typing import Dict, NamedTuple, Optional
+from fastapi import HTTPException, UploadFile
+from starlette.types import ASGIApp, Receive, Scope, Send
+from utils.metrics import STAGE_SECONDS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_IMAGE_SIZE_MB = float(os.getenv("MAX_IMAGE_SIZE_MB") or 20)
+# Cap on a whole request body, checked while it is received and before the
+# multipart form is parsed: room for two images plus the form fields
+MAX_REQUEST_BODY_MB = float(os.getenv("MAX_REQUEST_BODY_MB") or MAX_IMAGE_SIZE_MB * 2 + 1)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES") or 256 * 1024)
+# Most images a batch try-on takes on its "many" side
+TRYON_BATCH_MAX_ITEMS = int(os.getenv("TRYON_BATCH_MAX_ITEMS") or 8)
+# Body cap of the batch endpoints: the shared image plus TRYON_BATCH_MAX_ITEMS others
+MAX_BATCH_REQUEST_BODY_MB = float(
+    os.getenv("MAX_BATCH_REQUEST_BODY_MB") or MAX_IMAGE_SIZE_MB * (TRYON_BATCH_MAX_ITEMS + 1) + 1
+)
+
+# Magic-byte signatures of the image formats we accept
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+SNIFF_BYTES = 12
+
+class IngestedUpload(NamedTuple):
+    data: bytes
+    sha256: str
+    media_type: str
+    size: int
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Media type from the leading bytes of an image, or None if unrecognised"""
+    for signature, media_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+async def ingest_upload(upload: UploadFile, label: str, max_mb: float = MAX_IMAGE_SIZE_MB) -> IngestedUpload:
+    """
+    Read an uploaded image in chunks, hashing and sniffing it on the way.
+
+    Stops with 413 as soon as the size passes `max_mb`, and with 400 once the
+    leading bytes show it is not a JPEG, PNG or WebP; the declared content
+    type is not trusted. `label` names the field in error messages.
+    """
+    started = time.perf_counter()
+    max_bytes = int(max_mb * 1024 * 1024)
+    hasher = hashlib.sha256()
+    chunks = []
+    size = 0
+    media_type = None
+
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"{label.capitalize()} exceeds {max_mb:g}MB")
+
+        chunks.append(chunk)
+        hasher.update(chunk)
+
+        if media_type is None and size >= SNIFF_BYTES:
+            media_type = sniff_image_type(b"".join(chunks)[:SNIFF_BYTES])
+            if media_type is None:
+                raise HTTPException(status_code=400, detail=f"Unsupported {label} type")
+
+    if media_type is None:
+        # Too short to carry any image header
+        raise HTTPException(status_code=400, detail=f"Unsupported {label} type")
+
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="upload_read")
+    return IngestedUpload(b"".join(chunks), hasher.hexdigest(), media_type, size)
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies over `max_mb` before the app buffers them.
+
+    A declared Content-Length over the limit is refused at once; chunked
+    bodies are counted as they arrive and cut off with 413 when they pass it.
+    `path_max_mb` sets other limits for exact paths, e.g. batch endpoints.
+    """
+
+    def __init__(self, app: ASGIApp, max_mb: float = MAX_REQUEST_BODY_MB, path_max_mb: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.max_mb = max_mb
+        self.path_max_mb = path_max_mb or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_mb = self.path_max_mb.get(scope["path"], self.max_mb)
+        max_bytes = int(max_mb * 1024 * 1024)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._reject(send, max_mb)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Raised from inside body parsing; FastAPI re-raises HTTPException as-is
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {max_mb:g}MB")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send: Send, max_mb: float):
+        body = f'{{"detail":"Request body exceeds {max_mb:g}MB"}}'.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,107 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas.user import User
+from utils.security import decode_access_token
+from utils.metrics import CACHE_HITS, CACHE_MISSES
+from dotenv import load_dotenv
+
+load_dotenv()
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS") or 60)
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES") or 1024)
+
+class UserCache:
+    """
+    Small TTL + LRU cache of user rows keyed by username.
+
+    Stores plain dict snapshots (never ORM objects, which are bound to the
+    session that loaded them). Call `invalidate` whenever a user row changes.
+    """
+
+    def __init__(self, ttl_seconds: float = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[dict]:
+        entry = self._entries.get(username)
+        if entry is None:
+            self.misses += 1
+            CACHE_MISSES.inc(cache="user")
+            return None
+
+        snapshot, stored_at = entry
+        if time.time() - stored_at >= self.ttl_seconds:
+            del self._entries[username]
+            self.misses += 1
+            CACHE_MISSES.inc(cache="user")
+            return None
+
+        self._entries.move_to_end(username)
+        self.hits += 1
+        CACHE_HITS.inc(cache="user")
+        return snapshot
+
+    def set(self, snapshot: dict):
+        self._entries[snapshot["username"]] = (snapshot, time.time())
+        self._entries.move_to_end(snapshot["username"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+user_cache = UserCache()
+
+def user_snapshot(user: User) -> dict:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "username": user.username,
+        "role": user.role,
+        "createdAt": user.createdAt
+    }
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[dict]:
+    """Cached user lookup; misses are not cached so new sign-ups show up at once"""
+    snapshot = user_cache.get(username)
+    if snapshot is not None:
+        return snapshot
+
+    user = await db.scalar(select(User).where(User.username == username))
+    if not user:
+        return None
+
+    snapshot = user_snapshot(user)
+    user_cache.set(snapshot)
+    return snapshot
+
+def user_from_authorization(authorization: Optional[str]) -> Optional[dict]:
+    """
+    Claims of a `Authorization: Bearer <token>` header, or None when absent.
+
+    Raises 401 for a malformed, forged or expired token.
+    """
+    if not authorization:
+        return None
+
+    scheme, _, token = authorization.partition(" ")
+    claims = decode_access_token(token.strip()) if scheme.lower() == "bearer" else None
+    if not claims:
+        raise HTTPException(status_code=401, detail="Invalid or expired session, please login again")
+
+    return {
+        "id": claims["sub"],
+        "username": claims["username"],
+        "role": claims["role"]
+    }